@@ -45,6 +45,10 @@ upload_redis = redis.StrictRedis(
     db=Config.UPLOAD_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
 email_redis = redis.StrictRedis(
     db=Config.EMAIL_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+es_sync_redis = redis.StrictRedis(
+    db=Config.ES_SYNC_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
+search_cache_redis = redis.StrictRedis(
+    db=Config.SEARCH_CACHE_REDIS_DB, host=Config.REDIS_HOST, port=Config.REDIS_PORT)
 
 holidays = NYCHolidays(years=[year for year in range(Config.APP_LAUNCH_DATE.year, date.today().year + 5)])
 calendar = Calendar(
@@ -6,7 +6,7 @@
 """
 import ssl
 from datetime import datetime
-from json import dumps
+from json import dumps, loads
 from urllib.parse import urljoin, urlparse
 
 import hmac
@@ -19,13 +19,16 @@ from flask_login import current_user, login_user, logout_user
 from hashlib import sha256
 from ldap3 import Connection, Server, Tls
 from requests.exceptions import SSLError
+from sqlalchemy.orm import make_transient_to_detached
 
 from app import (
+    db,
     login_manager,
-    sentry
+    sentry,
+    store
 )
 from app.auth.constants import error_msg
-from app.constants import event_type
+from app.constants import event_type, PRINCIPAL_KEY, PRINCIPAL_VERSION_KEY
 from app.constants.bulk_updates import EventsDict
 from app.constants.web_services import (
     EMAIL_VALIDATION_ENDPOINT, EMAIL_VALIDATION_STATUS_ENDPOINT,
@@ -35,6 +38,7 @@ from app.lib.db_utils import create_object, update_object
 from app.lib.onelogin.saml2.auth import OneLogin_Saml2_Auth
 from app.lib.onelogin.saml2.utils import OneLogin_Saml2_Utils
 from app.lib.user_information import create_mailing_address
+from app.lib.utils import set_memoized
 from app.models import AgencyUsers, Events, UserRequests, Users
 from app.user.utils import es_update_assigned_users
 
@@ -44,13 +48,78 @@ from app.user.utils import es_update_assigned_users
 def user_loader(guid: str) -> Users:
     """Given a GUID return the associated User object.
 
+    The user's fields, agency flags and MFA status are cached in the session store as a
+    snapshot, versioned by PRINCIPAL_VERSION_KEY, so that authenticated page loads do not
+    query them. The version is incremented whenever the user, their agencies or their MFA
+    devices change (see app.models.mark_principals_changed), which discards the snapshot.
+
     Args:
         guid (str): User ID (GUID) of the user to retrieve from the database.
 
     Returns:
         Users: User object from the database or None.
     """
-    return Users.query.filter_by(guid=guid).one_or_none()
+    ttl = current_app.config['PRINCIPAL_CACHE_TTL']
+    if not ttl:
+        return Users.query.filter_by(guid=guid).one_or_none()
+
+    snapshot, version = store.mget(PRINCIPAL_KEY.format(guid=guid), PRINCIPAL_VERSION_KEY.format(guid=guid))
+    version = int(version or 0)
+    if snapshot is not None:
+        snapshot = loads(snapshot)
+        if snapshot['version'] == version:
+            return _load_principal(snapshot)
+
+    user = Users.query.filter_by(guid=guid).one_or_none()
+    if user is not None:
+        store.set(PRINCIPAL_KEY.format(guid=guid), dumps(_get_principal(user, version)), ex=ttl)
+    return user
+
+
+def _get_principal(user: Users, version: int) -> dict:
+    """Get the snapshot of a user cached by user_loader.
+
+    Args:
+        user (Users): User to take the snapshot of.
+        version (int): Version of the user's snapshot read before the user was loaded.
+
+    Returns:
+        dict: JSON-serializable snapshot of the user.
+    """
+    return {
+        'version': version,
+        'user': {key: getattr(user, key) for key in _get_principal_attrs()},
+        'agency_memberships': user.agency_memberships,
+        'has_mfa': user.has_mfa,
+    }
+
+
+def _get_principal_attrs() -> list:
+    """Get the keys of the Users attributes mapped to columns of the users table.
+
+    Read-only SQL expressions (e.g. the fullname column_property) are not included.
+
+    Returns:
+        list: Attribute keys (e.g. '_mailing_address' for the mailing_address column).
+    """
+    return [Users.__mapper__.get_property_by_column(column).key for column in Users.__table__.columns]
+
+
+def _load_principal(snapshot: dict) -> Users:
+    """Add the user from a snapshot taken by _get_principal to the session without querying the database.
+
+    Args:
+        snapshot (dict): Snapshot of the user.
+
+    Returns:
+        Users: User object in the current session.
+    """
+    user = Users(**{key: snapshot['user'][key] for key in _get_principal_attrs() if key in snapshot['user']})
+    make_transient_to_detached(user)
+    user = db.session.merge(user, load=False)
+    set_memoized(user, 'agency_memberships', snapshot['agency_memberships'])
+    set_memoized(user, 'has_mfa', snapshot['has_mfa'])
+    return user
 
 
 def update_openrecords_user(form):
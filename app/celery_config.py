@@ -12,6 +12,7 @@ imports = ['app.jobs']
 result_expires = 30
 timezone = 'EST'
 CELERY_CLEAR_EXPIRED_SESSION_IDS_INTERVAL = os.environ.get('CELERY_CLEAR_EXPIRED_SESSION_IDS_INTERVAL', '*/1')
+ELASTICSEARCH_SYNC_MAX_STALENESS = float(os.environ.get('ELASTICSEARCH_SYNC_MAX_STALENESS', 10))
 
 accept_content = ['pickle', 'json', 'msgpack', 'yaml']
 
@@ -31,5 +32,15 @@ beat_schedule = {
     'clear_expired_session_ids': {
         'task': 'app.jobs.clear_expired_session_ids',
         'schedule': crontab(minute=CELERY_CLEAR_EXPIRED_SESSION_IDS_INTERVAL)
+    },
+    # Every ELASTICSEARCH_SYNC_MAX_STALENESS seconds
+    'flush_es_sync_queue': {
+        'task': 'app.search.utils.flush_es_sync_queue',
+        'schedule': ELASTICSEARCH_SYNC_MAX_STALENESS
+    },
+    # Every hour
+    'delete_expired_exports': {
+        'task': 'app.search.utils.delete_expired_exports',
+        'schedule': crontab(minute='0')
     }
 }
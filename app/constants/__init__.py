@@ -120,4 +120,8 @@ CONFIRMATION_LETTER_HEADER_TO_REQUESTER = "The following will be mailed to the R
 
 HIDDEN_AGENCIES = [
     '002Q',  # Mayor's Office of Technology and Innovation - OS-1269
-]
\ No newline at end of file
+]
+# snapshot of a user (user fields, agency flags and MFA status) cached by app.auth.utils.user_loader
+PRINCIPAL_KEY = 'principal:{guid}'
+# incremented whenever a user's snapshot is invalidated; snapshots of older versions are ignored
+PRINCIPAL_VERSION_KEY = 'principal:{guid}:version'
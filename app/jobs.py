@@ -1,19 +1,25 @@
 import traceback
+from collections import defaultdict
 from datetime import datetime
+from time import perf_counter
 
 # import celery
-from celery import Celery
+from celery import Celery, group
+from elasticsearch.helpers import bulk
 from flask import (current_app, render_template)
 from psycopg2 import OperationalError
+from sqlalchemy import and_, or_, select, update
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
 
-from app import calendar, db, store
-from app.constants import OPENRECORDS_DL_EMAIL, request_status
+from app import calendar, celery, db, es, store
+from app.constants import OPENRECORDS_DL_EMAIL, bulk_updates, request_status
 from app.constants.event_type import EMAIL_NOTIFICATION_SENT, REQ_STATUS_CHANGED
 from app.constants.response_privacy import PRIVATE
-from app.lib.db_utils import create_object, update_object
+from app.lib.db_utils import bulk_update_objects
 from app.lib.email_utils import send_email
 from app.models import Agencies, Emails, Events, Requests, Users
+from app.search.utils import enqueue_es_sync, invalidate_search_cache
 
 # NOTE: (For Future Reference)
 # If we find ourselves in need of a request context, app.test_request_context() might come in handy.
@@ -36,123 +42,196 @@ app = Celery()
 #         )
 
 
-def _update_request_statuses():
+def _update_request_statuses(dry_run=False):
     """
     Update statuses for all requests that are now Due Soon or Overdue
     and send a notification email to agency admins listing the requests.
+
+    Each status transition is a single UPDATE ... RETURNING, the resulting
+    Events are bulk-inserted and the elasticsearch docs are updated in a
+    single bulk request. The emails are sent by a group of
+    send_request_statuses_email subtasks, one per agency.
+
+    :param dry_run: only count the requests that would be updated and the
+        agencies that would be notified; nothing is written or sent
+    :return: dict of the number of requests updated to each status, the
+        number of agencies notified and the elapsed time in seconds
     """
+    start_time = perf_counter()
     now = datetime.utcnow()
     due_soon_date = calendar.addbusdays(
         now, current_app.config['DUE_SOON_DAYS_THRESHOLD']
     ).replace(hour=23, minute=59, second=59)  # the entire day
 
-    agencies = Agencies.query.with_entities(Agencies.ein).filter_by(is_active=True).all()
-    for agency_ein, in agencies:
-        requests_overdue = Requests.query.filter(
-            Requests.due_date < now,
-            Requests.status != request_status.CLOSED,
-            Requests.agency_ein == agency_ein
-        ).order_by(
-            Requests.due_date.asc()
-        ).all()
-
-        requests_due_soon = Requests.query.filter(
-            Requests.due_date > now,
-            Requests.due_date <= due_soon_date,
-            Requests.status != request_status.CLOSED,
-            Requests.agency_ein == agency_ein
-        ).order_by(
-            Requests.due_date.asc()
-        ).all()
-
-        if not requests_overdue and not requests_due_soon:
-            continue
-
-        agency_requests_overdue = []
-        agency_acknowledgments_overdue = []
-        agency_requests_due_soon = []
-        agency_acknowledgments_due_soon = []
-
-        # OVERDUE
-        for request in requests_overdue:
-
-            if request.was_acknowledged:
-                agency_requests_overdue.append(request)
-            else:
-                agency_acknowledgments_overdue.append(request)
-
-            if request.status != request_status.OVERDUE:
-                create_object(
-                    Events(
-                        request.id,
-                        user_guid=None,
-                        type_=REQ_STATUS_CHANGED,
-                        previous_value={"status": request.status},
-                        new_value={"status": request_status.OVERDUE},
-                        response_id=None,
-                    )
-                )
-                update_object(
-                    {"status": request_status.OVERDUE},
-                    Requests,
-                    request.id)
-
-        # DUE SOON
-        for request in requests_due_soon:
-
-            if request.was_acknowledged:
-                agency_requests_due_soon.append(request)
-            else:
-                agency_acknowledgments_due_soon.append(request)
-
-            if request.status != request_status.DUE_SOON:
-                create_object(
-                    Events(
-                        request.id,
-                        user_guid=None,
-                        type_=REQ_STATUS_CHANGED,
-                        previous_value={"status": request.status},
-                        new_value={"status": request_status.DUE_SOON},
-                        response_id=None,
-                    )
-                )
-                update_object(
-                    {"status": request_status.DUE_SOON},
-                    Requests,
-                    request.id)
-
-        # mail to agency admins for each agency
-        user_emails = list(set(admin.notification_email or admin.email for admin
-                               in Agencies.query.filter_by(ein=agency_ein).one().administrators))
-
-        send_email(
-            STATUSES_EMAIL_SUBJECT,
-            to=user_emails,
-            template=STATUSES_EMAIL_TEMPLATE,
-            requests_overdue=agency_requests_overdue,
-            acknowledgments_overdue=agency_acknowledgments_overdue,
-            requests_due_soon=agency_requests_due_soon,
-            acknowledgments_due_soon=agency_acknowledgments_due_soon
-        )
-        email = Emails(
-            request.id,
-            PRIVATE,
-            to=','.join(user_emails),
-            cc=None,
-            bcc=None,
-            subject=STATUSES_EMAIL_SUBJECT,
-            body=render_template(
-                STATUSES_EMAIL_TEMPLATE + ".html",
-                requests_overdue=agency_requests_overdue,
-                acknowledgments_overdue=agency_acknowledgments_overdue,
-                requests_due_soon=agency_requests_due_soon,
-                acknowledgments_due_soon=agency_acknowledgments_due_soon
+    active_agencies = select(Agencies.ein).where(Agencies.is_active == True)  # noqa: E712
+    is_overdue = and_(
+        Requests.due_date < now,
+        Requests.status != request_status.CLOSED,
+        Requests.agency_ein.in_(active_agencies)
+    )
+    is_due_soon = and_(
+        Requests.due_date > now,
+        Requests.due_date <= due_soon_date,
+        Requests.status != request_status.CLOSED,
+        Requests.agency_ein.in_(active_agencies)
+    )
+
+    updated = {
+        request_status.OVERDUE: _set_request_statuses(is_overdue, request_status.OVERDUE, dry_run),
+        request_status.DUE_SOON: _set_request_statuses(is_due_soon, request_status.DUE_SOON, dry_run),
+    }
+
+    if not dry_run:
+        db.session.bulk_insert_mappings(Events, [
+            bulk_updates.EventsDict(
+                request_id=request_id,
+                user_guid=None,
+                response_id=None,
+                type=REQ_STATUS_CHANGED,
+                timestamp=now,
+                previous_value={"status": previous_status},
+                new_value={"status": status},
             )
+            for status, rows in updated.items() for request_id, previous_status in rows
+        ])
+        db.session.commit()
+        _es_update_request_statuses(updated)
+
+    requests = db.session.query(
+        Requests.id, Requests.agency_ein, Requests.due_date, Requests.date_acknowledged.isnot(None)
+    ).filter(
+        or_(is_overdue, is_due_soon)
+    ).order_by(
+        Requests.due_date.asc()
+    )
+
+    agency_requests = defaultdict(lambda: {
+        "requests_overdue": [],
+        "acknowledgments_overdue": [],
+        "requests_due_soon": [],
+        "acknowledgments_due_soon": [],
+    })
+    for request_id, agency_ein, due_date, was_acknowledged in requests:
+        if due_date < now:
+            key = "requests_overdue" if was_acknowledged else "acknowledgments_overdue"
+        else:
+            key = "requests_due_soon" if was_acknowledged else "acknowledgments_due_soon"
+        agency_requests[agency_ein][key].append(request_id)
+
+    if not dry_run:
+        # one subtask per agency so that notifying scales with the number of workers
+        group(
+            send_request_statuses_email.s(agency_ein, **request_ids)
+            for agency_ein, request_ids in agency_requests.items()
+        ).apply_async()
+
+    return {
+        "overdue": len(updated[request_status.OVERDUE]),
+        "due_soon": len(updated[request_status.DUE_SOON]),
+        "agencies_notified": len(agency_requests),
+        "elapsed": perf_counter() - start_time,
+    }
+
+
+def _set_request_statuses(condition, status, dry_run=False):
+    """
+    Set the status of every request matching the condition that does not already have it,
+    in a single UPDATE ... RETURNING.
+
+    :param condition: sqlalchemy filter on Requests
+    :param status: new request status
+    :param dry_run: only select the requests that would be updated
+    :return: list of (request id, previous status) rows
+    """
+    previous = select(Requests.id, Requests.status).where(condition, Requests.status != status)
+    if dry_run:
+        return db.session.execute(previous).all()
+    previous = previous.with_for_update().subquery()
+    requests = Requests.__table__
+    return db.session.execute(
+        update(requests).where(
+            requests.c.id == previous.c.id
+        ).values(
+            status=status
+        ).returning(requests.c.id, previous.c.status)
+    ).all()
+
+
+def _es_update_request_statuses(updated):
+    """
+    Update the status of request docs in a single elasticsearch bulk request
+    (or queue them to be synced if ELASTICSEARCH_DEFERRED_SYNC is set).
+
+    :param updated: dict of new status to list of (request id, previous status) rows
+    """
+    if not current_app.config['ELASTICSEARCH_ENABLED']:
+        return
+    if current_app.config['ELASTICSEARCH_DEFERRED_SYNC']:
+        enqueue_es_sync([request_id for rows in updated.values() for request_id, _ in rows])
+        return
+    bulk(
+        es,
+        (
+            {
+                '_op_type': 'update',
+                '_id': request_id,
+                'doc': {'status': status},
+            }
+            for status, rows in updated.items() for request_id, _ in rows
+        ),
+        index=current_app.config['ELASTICSEARCH_INDEX'],
+        chunk_size=current_app.config['ELASTICSEARCH_CHUNK_SIZE'],
+    )
+    invalidate_search_cache()
+
+
+@celery.task(bind=True, name='app.jobs.send_request_statuses_email',
+             autoretry_for=(OperationalError, SQLAlchemyError,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def send_request_statuses_email(self, agency_ein, requests_overdue, acknowledgments_overdue,
+                                requests_due_soon, acknowledgments_due_soon):
+    """
+    Email an agency's admins the lists of its overdue and due soon requests
+    and store the email as a response to the last request listed.
+
+    The lists are of request ids, in the order the requests should be listed.
+    """
+    request_ids = requests_overdue + acknowledgments_overdue + requests_due_soon + acknowledgments_due_soon
+    requests = {
+        request.id: request for request in Requests.query.filter(
+            Requests.id.in_(request_ids)
+        ).options(
+            selectinload(Requests.requester)
         )
-        create_object(email)
-        create_object(
+    }
+    lists = {
+        name: [requests[request_id] for request_id in ids]
+        for name, ids in (
+            ("requests_overdue", requests_overdue),
+            ("acknowledgments_overdue", acknowledgments_overdue),
+            ("requests_due_soon", requests_due_soon),
+            ("acknowledgments_due_soon", acknowledgments_due_soon),
+        )
+    }
+    agency = Agencies.query.filter_by(ein=agency_ein).options(selectinload(Agencies.administrators)).one()
+    user_emails = list(set(admin.notification_email or admin.email for admin in agency.administrators))
+    request_id = (requests_due_soon or acknowledgments_due_soon or requests_overdue or acknowledgments_overdue)[-1]
+
+    # rendered once for both sending and storing
+    body = render_template(STATUSES_EMAIL_TEMPLATE + ".html", **lists)
+    email = Emails(
+        request_id,
+        PRIVATE,
+        to=','.join(user_emails),
+        cc=None,
+        bcc=None,
+        subject=STATUSES_EMAIL_SUBJECT,
+        body=body
+    )
+    try:
+        db.session.add(email)
+        db.session.add(
             Events(
-                request.id,
+                request_id,
                 user_guid=None,
                 type_=EMAIL_NOTIFICATION_SENT,
                 previous_value=None,
@@ -161,6 +240,17 @@ def _update_request_statuses():
                 timestamp=datetime.utcnow()
             )
         )
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+    # sent only once stored, so that retries do not send duplicate emails
+    send_email(
+        STATUSES_EMAIL_SUBJECT,
+        to=user_emails,
+        email_content=body
+    )
 
 
 @app.task(autoretry_for=(OperationalError, SQLAlchemyError,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
@@ -170,9 +260,8 @@ def update_next_request_number():
     :return:
     """
     try:
-        for agency in Agencies.query.all():
-            agency.next_request_number = 1
-            db.session.add(agency)
+        agencies = Agencies.__table__
+        db.session.execute(update(agencies).values(next_request_number=1))
         db.session.commit()
     except SQLAlchemyError:
         db.session.rollback()
@@ -186,12 +275,10 @@ def clear_expired_session_ids():
     """
     users = Users.query.with_entities(Users.guid, Users.session_id).filter(Users.session_id.isnot(None)).all()
     if users:
-        for user in users:
-            if store.get("session:" + user[1]) is None:
-                update_object(
-                    {
-                        'session_id': None
-                    },
-                    Users,
-                    user[0]
-                )
+        sessions = store.mget(["session:" + user[1] for user in users])
+        # session ids are not part of the elasticsearch request docs
+        bulk_update_objects(
+            Users,
+            {user[0]: {'session_id': None} for user, session in zip(users, sessions) if session is None},
+            es_update=False
+        )
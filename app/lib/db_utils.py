@@ -5,10 +5,14 @@
 """
 from flask import current_app
 from app import db, sentry
-from app.models import Agencies, Requests
-from app.constants import HIDDEN_AGENCIES
+from app.models import Agencies, Requests, UserRequests, Users, mark_principals_changed
+from app.constants import HIDDEN_AGENCIES, user_type_request
+from app.lib.permission_utils import clear_permissions_masks
+from app.search.utils import es_index_requests
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
 
 def create_object(obj):
@@ -83,6 +87,68 @@ def update_object(data, obj_type, obj_id, es_update=True):
     return False
 
 
+def bulk_update_objects(obj_type, data, es_update=True):
+    """
+    Update multiple database records with a single bulk update and commit
+    and their elasticsearch counterparts with a single bulk request.
+
+    Dictionary values are merged into the existing json values, as with update_object;
+    only the records with such values are loaded (in a single query).
+    Objects of obj_type already loaded in the session are not updated.
+    If the update fails, the session is rolled back and the error is re-raised.
+
+    :param obj_type: sqlalchemy model
+    :param data: dictionary of record id to dictionary of attribute-value pairs
+    :param es_update: update the elasticsearch index
+    """
+    if not data:
+        return
+    pk = obj_type.__mapper__.primary_key[0].key
+
+    json_ids = [obj_id for obj_id, values in data.items()
+                if any(isinstance(value, dict) for value in values.values())]
+    current = {}
+    if json_ids:
+        current = {getattr(obj, pk): obj
+                   for obj in obj_type.query.filter(getattr(obj_type, pk).in_(json_ids))}
+
+    mappings = []
+    for obj_id, values in data.items():
+        mapping = {pk: obj_id}
+        for attr, value in values.items():
+            if isinstance(value, dict):
+                # update json values
+                value = {**(getattr(current[obj_id], attr) or {}), **value}
+            mapping[attr] = value
+        mappings.append(mapping)
+
+    try:
+        db.session.bulk_update_mappings(obj_type, mappings)
+        if obj_type is Users:
+            # bulk operations do not emit the mapper events that invalidate cached users
+            mark_principals_changed(db.session, data.keys())
+        db.session.commit()
+    except SQLAlchemyError:
+        sentry.captureException()
+        db.session.rollback()
+        current_app.logger.exception("Failed to BULK UPDATE {} {}".format(len(mappings), obj_type.__name__))
+        raise
+    # bulk operations do not emit the mapper events that clear cached permissions
+    if obj_type is UserRequests:
+        clear_permissions_masks()
+
+    # update elasticsearch
+    if hasattr(obj_type, 'es_update') and current_app.config['ELASTICSEARCH_ENABLED'] and es_update:
+        if obj_type is Requests:
+            request_ids = list(data.keys())
+        else:
+            # request docs include the requester's name
+            request_ids = [request_id for request_id, in db.session.query(UserRequests.request_id).filter(
+                UserRequests.user_guid.in_(data.keys()),
+                UserRequests.request_user_type == user_type_request.REQUESTER)]
+        es_index_requests(request_ids)
+
+
 def delete_object(obj):
     """
     Delete a database record.
@@ -143,3 +209,40 @@ def get_agency_choices():
                       for agencies in db.session.query(Agencies).all() if agencies.ein not in HIDDEN_AGENCIES],
                      key=lambda x: x[1])
     return choices
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (ANALYZE, FORMAT JSON) of a select statement.
+
+    The statement is compiled with its bound parameters, so ORM queries can be explained as they are.
+    """
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (ANALYZE, FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def explain_analyze(query):
+    """
+    Run a query with EXPLAIN ANALYZE.
+
+    :param query: sqlalchemy query or select statement
+
+    :return: (plan, list of tables read with a sequential scan)
+    """
+    statement = getattr(query, "statement", query)
+    plan = db.session.execute(Explain(statement)).scalar()[0]["Plan"]
+    seq_scans = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return plan, seq_scans
@@ -10,11 +10,12 @@ import os
 import magic
 import hashlib
 import paramiko
-import shutil
-from tempfile import TemporaryFile
-from functools import wraps
+import threading
+from time import monotonic
+from urllib.parse import quote
+from functools import partial, wraps
 from contextlib import contextmanager
-from flask import current_app, send_from_directory, redirect
+from flask import current_app, g, has_app_context, redirect, request, send_file as flask_send_file
 from app import sentry
 from azure.storage.blob import (generate_blob_sas,
                                 BlobSasPermissions,
@@ -24,22 +25,19 @@ from azure.storage.blob import (generate_blob_sas,
                                 )
 from datetime import datetime, timedelta
 
-TRANSFER_SIZE_LIMIT = 512000  # 512 kb
-
-
-class MaxTransferSizeExceededException(Exception):
-    pass
+MIME_SNIFF_SIZE = 512000  # 512 kb, read from the start of a file to detect its mime type
+FILE_CHUNK_SIZE = 1048576  # 1 mb, read at a time when hashing a file
 
 
 class SFTPCredentialsException(Exception):
     pass
 
 
-@contextmanager
-def sftp_ctx():
+def _sftp_connect():
     """
-    Context manager that provides an SFTP client object
-    (an SFTP session across an open SSH Transport)
+    Open an SSH Transport to the SFTP server and an SFTP session across it.
+
+    :return: (paramiko.Transport, paramiko.SFTPClient)
     """
     transport = paramiko.Transport((current_app.config['SFTP_HOSTNAME'],
                                     int(current_app.config['SFTP_PORT'])))
@@ -52,15 +50,140 @@ def sftp_ctx():
         raise SFTPCredentialsException
 
     transport.connect(username=current_app.config['SFTP_USERNAME'], **authentication_kwarg)
-    sftp = paramiko.SFTPClient.from_transport(transport)
+    transport.set_keepalive(current_app.config['SFTP_KEEPALIVE'])
+    return transport, paramiko.SFTPClient.from_transport(transport)
+
+
+class SFTPConnectionPool(object):
+    """
+    Thread-safe pool of SFTP sessions (and their SSH Transports) for a process.
+
+    Sessions are checked out with acquire() and returned with release(); at most
+    SFTP_POOL_SIZE idle sessions are kept open and sessions idle for more than
+    SFTP_POOL_MAX_IDLE seconds are closed. A session is only reused if its
+    Transport is still active. The pool is emptied in forked child processes
+    (gunicorn and celery workers) since SSH connections cannot be shared.
+
+    The pool settings are read by acquire() so that sessions can be released
+    without an app context (e.g. when a streamed response is closed).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = []  # [(transport, sftp, time released)], most recently released last
+        self._size = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @staticmethod
+    def _close(transport, sftp):
+        try:
+            sftp.close()
+            transport.close()
+        except Exception:
+            sentry.captureException()
+
+    def acquire(self):
+        """
+        Check out an open SFTP session, opening a new one if none is idle.
+
+        :return: (paramiko.Transport, paramiko.SFTPClient)
+        """
+        expired = []
+        session = None
+        with self._lock:
+            self._size = current_app.config['SFTP_POOL_SIZE']
+            evict_before = monotonic() - current_app.config['SFTP_POOL_MAX_IDLE']
+            while self._idle:
+                transport, sftp, released = self._idle.pop()
+                if released < evict_before or not transport.is_active():
+                    expired.append((transport, sftp))
+                else:
+                    session = transport, sftp
+                    break
+        for transport, sftp in expired:
+            self._close(transport, sftp)
+        return session or _sftp_connect()
+
+    def release(self, transport, sftp, discard=False):
+        """
+        Return a session checked out with acquire() to the pool.
+
+        :param discard: close the session instead (e.g. after an error)
+        """
+        if not discard and transport.is_active():
+            with self._lock:
+                if len(self._idle) < self._size:
+                    self._idle.append((transport, sftp, monotonic()))
+                    return
+        self._close(transport, sftp)
+
+    def clear(self):
+        """
+        Close all idle sessions.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for transport, sftp, _ in idle:
+            self._close(transport, sftp)
+
+
+sftp_pool = SFTPConnectionPool()
+
+
+@contextmanager
+def sftp_ctx():
+    """
+    Context manager that provides an SFTP client object
+    (an SFTP session across an open SSH Transport)
+    checked out from the process' session pool, or the
+    session of the enclosing sftp_batch block.
+    """
+    sftp = g.get('sftp_batch') if has_app_context() else None
+    transport = None
+    if sftp is None:
+        transport, sftp = sftp_pool.acquire()
+    discard = False
     try:
         yield sftp
     except Exception as e:
+        discard = True
         sentry.captureException()
         raise paramiko.SFTPError("Exception occurred with SFTP: {}".format(e))
     finally:
-        sftp.close()
-        transport.close()
+        if transport is not None:
+            sftp_pool.release(transport, sftp, discard=discard)
+
+
+@contextmanager
+def sftp_batch():
+    """
+    Context manager that makes every file operation in its block use the same SFTP session.
+    Does nothing if the app is not using SFTP.
+
+    Ex:
+        with fu.sftp_batch():
+            size = fu.getsize(path)
+            hash_ = fu.get_hash(path)
+    """
+    if not current_app.config['USE_SFTP'] or g.get('sftp_batch') is not None:
+        yield
+        return
+    transport, sftp = sftp_pool.acquire()
+    g.sftp_batch = sftp
+    discard = False
+    try:
+        yield
+    except Exception:
+        discard = True
+        raise
+    finally:
+        g.pop('sftp_batch', None)
+        sftp_pool.release(transport, sftp, discard=discard)
 
 
 def _sftp_switch(sftp_func):
@@ -82,11 +205,6 @@ def _sftp_switch(sftp_func):
     return decorator
 
 
-def _raise_if_too_big(bytes_transferred, _):
-    if bytes_transferred >= TRANSFER_SIZE_LIMIT:
-        raise MaxTransferSizeExceededException
-
-
 def _sftp_get_size(sftp, path):
     return sftp.stat(path).st_size
 
@@ -133,49 +251,59 @@ def _sftp_move(sftp, localpath, remotepath):
 
 
 def _sftp_get_mime_type(sftp, path):
-    with TemporaryFile() as tmp:
-        try:
-            sftp.getfo(path, tmp, _raise_if_too_big)
-        except MaxTransferSizeExceededException:
-            sentry.captureException()
-        tmp.seek(0)
-        if current_app.config['MAGIC_FILE']:
-            # Check using custom mime database file
-            m = magic.Magic(
-                magic_file=current_app.config['MAGIC_FILE'],
-                mime=True)
-            mime_type = m.from_buffer(tmp.read())
-        else:
-            mime_type = magic.from_buffer(tmp.read(), mime=True)
-    return mime_type
+    with sftp.open(path, 'rb') as fp:
+        return _get_mime_type_from_buffer(fp.read(MIME_SNIFF_SIZE))
 
 
 def _sftp_get_hash(sftp, path):
-    sha1 = hashlib.sha1()
-    with TemporaryFile() as tmp:
-        sftp.getfo(path, tmp)
-        tmp.seek(0)
-        sha1.update(tmp.read())
-    return sha1.hexdigest()
+    with sftp.open(path, 'rb') as fp:
+        return _get_hash(fp)
 
 
-def _sftp_send_file(sftp, directory, filename, **kwargs):
-    localpath = _get_file_serving_path(directory, filename)
-    if not os.path.exists(localpath):
-        sftp.get(os.path.join(directory, filename), localpath)
-    return send_from_directory(*os.path.split(localpath), **kwargs)
+def _sftp_get_file_metadata(sftp, path):
+    with sftp.open(path, 'rb') as fp:
+        return _read_file_metadata(fp)
 
 
-def _get_file_serving_path(directory, filename):
+def _sftp_send_file(path, etag=None, **kwargs):
     """
-    Returns the upload serving directory path for a file determined by supplied directory and filename.
+    Stream a file from the SFTP server.
+
+    The SFTP session is checked out of the pool until the response is closed.
     """
-    request_id_folder = os.path.basename(directory)
-    localpath = os.path.join(current_app.config['UPLOAD_SERVING_DIRECTORY'], request_id_folder)
-    if not os.path.exists(localpath):
-        os.mkdir(localpath)
-    path = os.path.join(request_id_folder, filename)
-    return os.path.join(current_app.config['UPLOAD_SERVING_DIRECTORY'], path)
+    transport, sftp = sftp_pool.acquire()
+    try:
+        file_ = sftp.open(path, 'rb')
+        size = file_.stat().st_size
+    except Exception:
+        sftp_pool.release(transport, sftp, discard=True)
+        raise
+    kwargs.setdefault('download_name', os.path.basename(path))
+    response = flask_send_file(file_, etag=etag or False, conditional=False, **kwargs)
+    response.content_length = size
+
+    @response.call_on_close
+    def close():
+        file_.close()
+        sftp_pool.release(transport, sftp)
+
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+
+
+def _accel_redirect_send_file(path, etag=None, **kwargs):
+    """
+    Hand a file in UPLOAD_DIRECTORY off to nginx, which sends it (and handles
+    range requests) from the internal location X_ACCEL_REDIRECT_LOCATION.
+    """
+    response = flask_send_file(path, etag=etag or True, conditional=False, **kwargs)
+    response.close()
+    response.response = []
+    del response.headers['Content-Length']
+    response.headers['X-Accel-Redirect'] = quote('/'.join((
+        current_app.config['X_ACCEL_REDIRECT_LOCATION'].rstrip('/'),
+        os.path.relpath(path, current_app.config['UPLOAD_DIRECTORY']).replace(os.sep, '/')
+    )))
+    return response.make_conditional(request)
 
 
 @_sftp_switch(_sftp_get_size)
@@ -223,15 +351,45 @@ def get_mime_type(path):
 
 
 def os_get_mime_type(path):
-    if current_app.config['MAGIC_FILE']:
-        # Check using custom mime database file
-        m = magic.Magic(
-            magic_file=current_app.config['MAGIC_FILE'],
-            mime=True)
-        mime_type = m.from_file(path)
-    else:
-        mime_type = magic.from_file(path, mime=True)
-    return mime_type
+    # Check using custom mime database file, if any
+    return get_magic(current_app.config['MAGIC_FILE']).from_file(path)
+
+
+def _get_mime_type_from_buffer(buffer):
+    return get_magic(current_app.config['MAGIC_FILE']).from_buffer(buffer)
+
+
+_magic_local = threading.local()
+
+
+def _reset_magic():
+    global _magic_local
+    _magic_local = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    # libmagic handles are not shared with forked (gunicorn and celery) worker processes
+    os.register_at_fork(after_in_child=_reset_magic)
+
+
+def get_magic(magic_file=None):
+    """
+    Returns this thread's mime type detector for a magic database file.
+
+    Loading a magic database (especially compiling a source database such as
+    MAGIC_FILE) is slow, so one magic.Magic is kept per thread and magic file.
+
+    :param magic_file: path to a magic database file (the system database if None)
+    :return: magic.Magic(mime=True)
+    """
+    magic_file = magic_file or None
+    detectors = getattr(_magic_local, 'detectors', None)
+    if detectors is None:
+        detectors = _magic_local.detectors = {}
+    detector = detectors.get(magic_file)
+    if detector is None:
+        detector = detectors[magic_file] = magic.Magic(magic_file=magic_file, mime=True)
+    return detector
 
 
 @_sftp_switch(_sftp_get_hash)
@@ -244,38 +402,155 @@ def get_hash(path):
 
 
 def os_get_hash(path):
-    sha1 = hashlib.sha1()
     with open(path, 'rb') as fp:
-        sha1.update(fp.read())
+        return _get_hash(fp)
+
+
+def _get_hash(fp):
+    """
+    Returns the sha1 hash of the contents of a file object,
+    read in chunks of FILE_CHUNK_SIZE bytes.
+    """
+    sha1 = hashlib.sha1()
+    for chunk in iter(partial(fp.read, FILE_CHUNK_SIZE), b''):
+        sha1.update(chunk)
     return sha1.hexdigest()
 
 
-@_sftp_switch(_sftp_send_file)
-def send_file(directory, filename, **kwargs):
-    path = _get_file_serving_path(directory, filename)
-    # Move file to data directory if volume storage enabled
-    if current_app.config['USE_VOLUME_STORAGE']:
-        shutil.copy(os.path.join(directory, filename), path)
+@_sftp_switch(_sftp_get_file_metadata)
+def get_file_metadata(path):
+    """
+    Returns a tuple containing a file's
+        ( size (int), mime type (str), and sha1 hash (str) ).
+
+    The file is read once, in chunks of FILE_CHUNK_SIZE bytes;
+    the mime type is detected from its first MIME_SNIFF_SIZE bytes.
+    """
+    return os_get_file_metadata(path)
+
+
+def os_get_file_metadata(path):
+    with open(path, 'rb') as fp:
+        return _read_file_metadata(fp)
+
+
+def _read_file_metadata(fp):
+    """
+    Returns the ( size, mime type, sha1 hash ) of the
+    contents of a file object, read in a single pass.
+    """
+    sha1 = hashlib.sha1()
+    size = 0
+    head = []
+    for chunk in iter(partial(fp.read, FILE_CHUNK_SIZE), b''):
+        sha1.update(chunk)
+        if size < MIME_SNIFF_SIZE:
+            head.append(chunk[:MIME_SNIFF_SIZE - size])
+        size += len(chunk)
+    return size, _get_mime_type_from_buffer(b''.join(head)), sha1.hexdigest()
+
+
+def send_file(directory, filename, etag=None, **kwargs):
+    """
+    Send a stored file straight from storage; files are not copied to a serving directory.
+
+    Responses are conditional: 'If-None-Match' is checked against the etag and
+    'Range' requests are supported. Local files are streamed with the WSGI
+    server's file wrapper (sendfile(2) under gunicorn) unless they are handed off
+    to the web server (USE_X_SENDFILE, X_ACCEL_REDIRECT_LOCATION), files stored
+    over SFTP are streamed from the SFTP server and Azure blobs are redirected to.
+
+    :param directory: directory of the file in storage
+    :param filename: name of the file
+    :param etag: entity tag of the file (e.g. the sha1 hash of a Files response);
+        if None, one is generated from the modification time and size of local files
+    :param kwargs: flask.send_file keyword arguments (e.g. as_attachment, download_name)
+    """
+    path = os.path.join(directory, filename)
+    if current_app.config['USE_SFTP']:
+        return _sftp_send_file(path, etag=etag, **kwargs)
     # Serve file from Azure if Azure storage is enabled
-    elif current_app.config['USE_AZURE_STORAGE']:
-        blob_url = azure_generate_blob_url(os.path.join(directory, filename))
+    if current_app.config['USE_AZURE_STORAGE'] and not current_app.config['USE_VOLUME_STORAGE']:
+        blob_url = azure_generate_blob_url(path)
         return redirect(blob_url)
-    return send_from_directory(*os.path.split(path), **kwargs)
+    if current_app.config['X_ACCEL_REDIRECT_LOCATION']:
+        return _accel_redirect_send_file(path, etag=etag, **kwargs)
+    return flask_send_file(path, etag=etag or True, **kwargs)
+
+
+_azure_service_clients = {}
+
+
+def _reset_azure_service_clients():
+    _azure_service_clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    # connection pools are not shared with forked (gunicorn and celery) worker processes
+    os.register_at_fork(after_in_child=_reset_azure_service_clients)
+
+
+def get_azure_service_client():
+    """
+    Returns the process' BlobServiceClient for AZURE_STORAGE_CONNECTION_STRING.
+
+    The client (and its HTTP connection pool) is shared by every thread of
+    the process instead of being created for each blob operation.
+    """
+    key = (current_app.config['AZURE_STORAGE_CONNECTION_STRING'],
+           current_app.config['AZURE_STORAGE_MAX_BLOCK_SIZE'],
+           current_app.config['AZURE_STORAGE_MAX_SINGLE_PUT_SIZE'])
+    client = _azure_service_clients.get(key)
+    if client is None:
+        connection_string, max_block_size, max_single_put_size = key
+        client = _azure_service_clients.setdefault(key, BlobServiceClient.from_connection_string(
+            connection_string,
+            max_block_size=max_block_size,
+            max_single_put_size=max_single_put_size))
+    return client
 
 
 def create_azure_blob_client(blob_name):
-    connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    return blob_service_client.get_blob_client(container=current_app.config['AZURE_STORAGE_CONTAINER'], blob=blob_name)
+    return get_azure_service_client().get_blob_client(container=current_app.config['AZURE_STORAGE_CONTAINER'],
+                                                      blob=blob_name)
 
 
 def azure_upload(source_path, blob_name):
+    """
+    Upload a local file to a blob and remove the local file.
+
+    Files larger than AZURE_STORAGE_MAX_SINGLE_PUT_SIZE are uploaded in blocks
+    of AZURE_STORAGE_MAX_BLOCK_SIZE, AZURE_STORAGE_MAX_CONCURRENCY at a time.
+    """
     blob_client = create_azure_blob_client(blob_name)
     with open(source_path, 'rb') as data:
-        blob_client.upload_blob(data, overwrite=True)
+        blob_client.upload_blob(data,
+                                length=os.fstat(data.fileno()).st_size,
+                                overwrite=True,
+                                max_concurrency=current_app.config['AZURE_STORAGE_MAX_CONCURRENCY'])
     os.remove(source_path)
 
 
+def azure_download(blob_name, target_path):
+    """
+    Download a blob to a local file, AZURE_STORAGE_MAX_CONCURRENCY chunks at a time.
+    """
+    blob_client = create_azure_blob_client(blob_name)
+    with open(target_path, 'wb') as target:
+        blob_client.download_blob(
+            max_concurrency=current_app.config['AZURE_STORAGE_MAX_CONCURRENCY']).readinto(target)
+
+
+def azure_stream(blob_name):
+    """
+    Returns an iterator over the contents of a blob, in chunks.
+
+    For internal consumers (e.g. celery tasks) that read blobs with the storage
+    account's credentials instead of following a SAS url.
+    """
+    return create_azure_blob_client(blob_name).download_blob().chunks()
+
+
 def azure_generate_blob_url(blob_name):
     # Generate SAS token
     sas_token = generate_blob_sas(account_name=current_app.config['AZURE_STORAGE_ACCOUNT_NAME'],
@@ -286,12 +561,7 @@ def azure_generate_blob_url(blob_name):
                                   expiry=datetime.utcnow() + timedelta(hours=1))
 
     # Generate blob URL
-    url = "https://{0}.blob.core.windows.net/{1}/{2}?{3}".format(
-        current_app.config['AZURE_STORAGE_ACCOUNT_NAME'],
-        current_app.config['AZURE_STORAGE_CONTAINER'],
-        blob_name,
-        sas_token)
-    return url
+    return "{0}?{1}".format(create_azure_blob_client(blob_name).url, sas_token)
 
 
 def azure_exists(blob_name):
@@ -305,6 +575,6 @@ def azure_delete(blob_name):
 
 
 def azure_copy(current_blob_name, new_blob_name):
+    # Blobs in the same storage account are copied with the account's credentials, without a SAS
     blob_client = create_azure_blob_client(new_blob_name)
-    url = azure_generate_blob_url(current_blob_name)
-    blob_client.start_copy_from_url(url)
+    blob_client.start_copy_from_url(create_azure_blob_client(current_blob_name).url)
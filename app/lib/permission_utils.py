@@ -1,12 +1,12 @@
 from functools import wraps
 
-from flask import abort, request, redirect
+from flask import abort, g, has_app_context, request, redirect
 from flask_login import current_user, login_url
-from sqlalchemy.orm.exc import NoResultFound
-from app import login_manager, sentry
+from app import db, login_manager
 from app.constants import permission
 from app.models import (
     Users,
+    UserRequests,
     Responses,
     Files,
     Notes,
@@ -61,25 +61,46 @@ def has_super():
     return decorator
 
 
-def is_allowed(user: Users, request_id: str, permission: int):
+def get_permissions_mask(user: Users, request_id: str):
     """
+    Get the permissions of a user for a request as a bitmask of app.constants.permission values.
 
-    :param user:
-    :param request_id:
-    :param permissions:
-    :return:
+    Masks are cached in flask.g for the rest of the HTTP request (or app context)
+    and cleared with clear_permissions_masks whenever UserRequests change.
+
+    :param user: user to get the permissions of
+    :param request_id: FOIL request id
+    :return: permissions bitmask; 0 if the user is not associated with the request
+    """
+    guid = getattr(user, 'guid', None)
+    if guid is None:
+        return 0
+    masks = g.setdefault('permissions_masks', {})
+    key = (guid, request_id)
+    if key not in masks:
+        masks[key] = db.session.query(UserRequests.permissions).filter_by(
+            user_guid=guid, request_id=request_id).scalar() or 0
+    return masks[key]
+
+
+def clear_permissions_masks():
+    """
+    Clear the permissions bitmasks cached by get_permissions_mask.
     """
-    try:
-        user_request = user.user_requests.filter_by(request_id=request_id).one()
-        return True if user_request.has_permission(permission) else False
+    if has_app_context():
+        g.pop('permissions_masks', None)
 
-    except NoResultFound:
-        sentry.captureException()
-        return False
 
-    except AttributeError:
-        sentry.captureException()
-        return False
+def is_allowed(user: Users, request_id: str, permission: int):
+    """
+    Check if a user has a permission for a request.
+
+    :param user: user to check
+    :param request_id: FOIL request id
+    :param permission: permission or bitwise OR of permissions, any of which is sufficient
+    :return: Boolean
+    """
+    return bool(get_permissions_mask(user, request_id) & permission)
 
 
 def get_permission(permission_type: str, response_type: Responses):
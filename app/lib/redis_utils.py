@@ -6,10 +6,7 @@ except ImportError:
     import pickle
 
 from app import upload_redis as redis
-from app.lib.file_utils import (
-    os_get_hash,
-    os_get_mime_type
-)
+from app.lib.file_utils import os_get_file_metadata
 
 
 # Redis File Utilities
@@ -17,13 +14,10 @@ def redis_set_file_metadata(request_or_response_id, filepath, is_update=False):
     """
     Stores a file's size, mime type, and hash.
     """
+    size, mime_type, hash_ = os_get_file_metadata(filepath)
     redis.set(
         _get_file_metadata_key(request_or_response_id, filepath, is_update),
-        ':'.join((
-            str(os.path.getsize(filepath)),
-            os_get_mime_type(filepath),
-            os_get_hash(filepath)
-        ))
+        ':'.join((str(size), mime_type, hash_))
     )
 
 
@@ -4,6 +4,7 @@
 """
 
 from base64 import b64decode
+from functools import wraps
 
 
 class InvalidUserException(Exception):
@@ -102,3 +103,45 @@ def eval_request_bool(val, default=False):
         if val in ['True', 'true', '1', 'y', 'yes', 'on']:
             return True
     return default
+
+
+def memoized_property(fget):
+    """
+    Decorator for a read-only property whose value is computed once
+    and stored on the instance until cleared with clear_memoized.
+
+    :param fget: getter function
+    :return: property
+    """
+    name = fget.__name__
+
+    @wraps(fget)
+    def getter(obj):
+        memo = obj.__dict__.setdefault('_memoized', {})
+        try:
+            return memo[name]
+        except KeyError:
+            memo[name] = value = fget(obj)
+            return value
+
+    return property(getter)
+
+
+def set_memoized(obj, name, value):
+    """
+    Set the value of a memoized property of an object, e.g. from a cache.
+
+    :param obj: object with memoized properties
+    :param name: name of the memoized property
+    :param value: value of the property
+    """
+    obj.__dict__.setdefault('_memoized', {})[name] = value
+
+
+def clear_memoized(obj):
+    """
+    Clear the values of all memoized properties of an object.
+
+    :param obj: object with memoized properties
+    """
+    obj.__dict__.pop('_memoized', None)
@@ -12,13 +12,13 @@ from flask import current_app, session
 from flask_login import UserMixin, AnonymousUserMixin, current_user
 from functools import reduce
 from operator import ior
-from sqlalchemy import desc
+from sqlalchemy import desc, event
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
-from sqlalchemy.orm import column_property
+from sqlalchemy.orm import Session, column_property, object_session
 from sqlalchemy.orm.exc import MultipleResultsFound
 from warnings import warn
 
-from app import db, es, calendar, sentry
+from app import db, es, calendar, sentry, store
 from app.constants import (
     ES_DATETIME_FORMAT,
     permission,
@@ -30,12 +30,15 @@ from app.constants import (
     response_privacy,
     submission_methods,
     event_type,
+    PRINCIPAL_VERSION_KEY,
 )
 from app.constants.request_date import RELEASE_PUBLIC_DAYS
 from app.constants.schemas import AGENCIES_SCHEMA
 from app.lib.json_schema import validate_schema
 from app.lib.utils import (
     eval_request_bool,
+    clear_memoized,
+    memoized_property,
     DuplicateFileException,
     InvalidDeterminationException,
 )
@@ -244,15 +247,12 @@ class Agencies(db.Model):
 
     @property
     def next_request_number(self):
-        from app.lib.db_utils import update_object
+        """
+        Next request number of the agency (only used for parent agencies).
 
-        num = self._next_request_number
-        update_object(
-            {"_next_request_number": self._next_request_number + 1},
-            Agencies,
-            self.formatted_parent_ein,
-        )
-        return num
+        Request numbers must be allocated with app.request.utils.generate_request_id.
+        """
+        return self._next_request_number
 
     @next_request_number.setter
     def next_request_number(self, value):
@@ -411,13 +411,31 @@ class Users(UserMixin, db.Model):
         """
         return self.is_nyc_employee
 
+    @memoized_property
+    def agency_memberships(self):
+        """
+        The user's agency flags by agency ein, loaded in a single query.
+
+        Part of the user snapshot cached by app.auth.utils.user_loader.
+        :return: {ein: {"is_agency_active": Boolean, "is_agency_admin": Boolean,
+                        "is_read_only": Boolean, "is_primary_agency": Boolean}}
+        """
+        return {
+            agency.agency_ein: {
+                "is_agency_active": agency.is_agency_active,
+                "is_agency_admin": agency.is_agency_admin,
+                "is_read_only": agency.is_read_only,
+                "is_primary_agency": agency.is_primary_agency,
+            }
+            for agency in self.agency_users.order_by(AgencyUsers.agency_ein)
+        }
+
     @property
     def get_agencies(self):
         """
         Returns a list of the agency ein's the user belongs to.
         """
-        agencies = AgencyUsers.query.filter_by(user_guid=self.guid).all()
-        return [agency.agency_ein for agency in agencies]
+        return list(self.agency_memberships)
 
     @property
     def default_agency_ein(self):
@@ -425,16 +443,9 @@ class Users(UserMixin, db.Model):
         Return the Users default agency ein.
         :return: String
         """
-        agency = (
-            AgencyUsers.query.join(Users)
-            .filter(
-                AgencyUsers.is_primary_agency == True,
-                AgencyUsers.user_guid == self.guid,
-            )
-            .one_or_none()
-        )
-        if agency is not None:
-            return agency.agency_ein
+        for ein, agency in self.agency_memberships.items():
+            if agency["is_primary_agency"]:
+                return ein
         return None
 
     @property
@@ -444,9 +455,9 @@ class Users(UserMixin, db.Model):
         If the user is admin for multiple agencies it will return the first one.
         :return: Agency ein
         """
-        for agency in AgencyUsers.query.filter_by(user_guid=self.guid):
-            if self.is_agency_admin(agency.agency_ein):
-                return agency.agency_ein
+        for ein, agency in self.agency_memberships.items():
+            if agency["is_agency_admin"]:
+                return ein
 
     @property
     def default_agency(self):
@@ -484,10 +495,7 @@ class Users(UserMixin, db.Model):
         Determine if a user is an admin for at least one agency.
         :return: Boolean
         """
-        for agency in self.agency_users.all():
-            if agency.is_agency_admin:
-                return True
-        return False
+        return any(agency["is_agency_admin"] for agency in self.agency_memberships.values())
 
     @property
     def has_agency_active(self):
@@ -495,10 +503,7 @@ class Users(UserMixin, db.Model):
         Determine if a user is active for at least one agency.
         :return: Boolean
         """
-        for agency in self.agency_users.all():
-            if agency.is_agency_active:
-                return True
-        return False
+        return any(agency["is_agency_active"] for agency in self.agency_memberships.values())
 
     def is_agency_admin(self, ein=None):
         """
@@ -508,10 +513,7 @@ class Users(UserMixin, db.Model):
         """
         if ein is None:
             ein = self.default_agency_ein
-        for agency in self.agency_users.all():
-            if agency.agency_ein == ein:
-                return agency.is_agency_admin
-        return False
+        return bool(self.agency_memberships.get(ein, {}).get("is_agency_admin"))
 
     def is_agency_active(self, ein=None):
         """
@@ -521,11 +523,7 @@ class Users(UserMixin, db.Model):
         """
         if ein is None:
             ein = self.default_agency_ein
-        for agency in self.agency_users.all():
-            if agency.agency_ein == ein:
-                return agency.is_agency_active
-        return False
-
+        return bool(self.agency_memberships.get(ein, {}).get("is_agency_active"))
 
     def is_agency_read_only(self, ein=None):
         """
@@ -535,10 +533,7 @@ class Users(UserMixin, db.Model):
         """
         if ein is None:
             ein = self.default_agency_ein
-        for agency in self.agency_users.all():
-            if agency.agency_ein == ein:
-                return agency.is_read_only
-        return False
+        return bool(self.agency_memberships.get(ein, {}).get("is_read_only"))
 
     def agencies_for_forms(self):
         agencies = self.agencies.with_entities(Agencies.ein, Agencies._name).all()
@@ -575,7 +570,7 @@ class Users(UserMixin, db.Model):
     def get_id(self):
         return self.guid
 
-    @property
+    @memoized_property
     def has_mfa(self):
         """
         Determine if a user has MFA set up.
@@ -592,8 +587,13 @@ class Users(UserMixin, db.Model):
         Call es_update for any request where this user is the requester
         since the request es doc relies on the requester's name.
         """
+        from app.search.utils import enqueue_es_sync, invalidate_search_cache
+
         if current_app.config["ELASTICSEARCH_ENABLED"]:
             requests = [request.id for request in self.requests]
+            if current_app.config["ELASTICSEARCH_DEFERRED_SYNC"]:
+                enqueue_es_sync(requests)
+                return
             actions = [
                 {
                     "_op_type": "update",
@@ -609,6 +609,7 @@ class Users(UserMixin, db.Model):
                 index=current_app.config["ELASTICSEARCH_INDEX"],
                 chunk_size=current_app.config["ELASTICSEARCH_CHUNK_SIZE"],
             )
+            invalidate_search_cache()
 
     @property
     def val_for_events(self):
@@ -767,6 +768,9 @@ class Requests(db.Model):
     agency_request_summary - a string that contains an additional description of the request created by the agency
     agency_request_summary_release_date - a datetime of when the agency_request_summary will be made public
     custom_metadata - a JSON that contains the metadata from an agency's custom request forms
+    date_acknowledged - a datetime of when the request was acknowledged (None if it has not been)
+    date_last_closed - a datetime of when the request was last closed or denied (None if it has not been)
+    reopen_count - the number of times the request has been re-opened
     """
 
     __tablename__ = "requests"
@@ -810,6 +814,15 @@ class Requests(db.Model):
     agency_request_summary = db.Column(db.String(5000))
     agency_request_summary_release_date = db.Column(db.DateTime)
     custom_metadata = db.Column(JSONB)
+    # maintained by app.response.utils when determinations are added (backfilled by migration 3c5f0e8a9b21)
+    date_acknowledged = db.Column(db.DateTime, index=True)
+    date_last_closed = db.Column(db.DateTime)
+    reopen_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # agency-scoped status/due date lookups (app.jobs, 'flask extend-requests')
+        db.Index("ix_requests_agency_ein_status_due_date", agency_ein, status, due_date),
+    )
 
     user_requests = db.relationship(
         "UserRequests", backref=db.backref("request", uselist=False), lazy="dynamic"
@@ -884,48 +897,25 @@ class Requests(db.Model):
 
     @property
     def was_acknowledged(self):
-        if (
-            self.responses.join(Determinations)
-            .filter(Determinations.dtype == determination_type.ACKNOWLEDGMENT)
-            .one_or_none()
-            is not None
-        ):
-            return True
-        return False
+        return self.date_acknowledged is not None
 
     @property
     def was_reopened(self):
-        return (
-            self.responses.join(Determinations)
-            .filter(Determinations.dtype == determination_type.REOPENING)
-            .first()
-            is not None
-        )
+        return bool(self.reopen_count)
 
     @property
     def last_date_closed(self):
         if self.status == request_status.CLOSED:
-            return (
-                self.responses.join(Determinations)
-                .filter(
-                    Determinations.dtype.in_(
-                        [determination_type.CLOSING, determination_type.DENIAL]
-                    )
-                )
-                .order_by(desc(Determinations.date_modified))
-                .limit(1)
-                .one()
-                .date_modified
-            )
+            return self.date_last_closed
         return None
 
-    @property
+    @memoized_property
     def days_until_due(self):
         return calendar.busdaycount(
             datetime.utcnow(), self.due_date.replace(hour=23, minute=59, second=59)
         )
 
-    @property
+    @memoized_property
     def show_title(self) -> bool:
         """Determine whether the title should be displayed on the front-end.
         The title may be displayed in the following circumstances:
@@ -981,8 +971,12 @@ class Requests(db.Model):
         )
 
     def es_update(self):
+        from app.search.utils import enqueue_es_sync, invalidate_search_cache
+
         if current_app.config["ELASTICSEARCH_ENABLED"]:
-            if self.agency.is_active:
+            if current_app.config["ELASTICSEARCH_DEFERRED_SYNC"]:
+                enqueue_es_sync([self.id])
+            elif self.agency.is_active:
                 es.update(
                     index=current_app.config["ELASTICSEARCH_INDEX"],
                     id=self.id,
@@ -1016,14 +1010,21 @@ class Requests(db.Model):
                     },
                     # refresh='wait_for'
                 )
+                invalidate_search_cache()
 
     def es_create(self):
         """ Must be called AFTER UserRequest has been created. """
+        from app.search.utils import enqueue_es_sync, invalidate_search_cache
+
         if current_app.config["ELASTICSEARCH_ENABLED"]:
+            if current_app.config["ELASTICSEARCH_DEFERRED_SYNC"]:
+                enqueue_es_sync([self.id])
+                return
             es.create(
                 index=current_app.config["ELASTICSEARCH_INDEX"],
                 id=self.id,
                 body={
+                    "foil_id": self.id,
                     "title": self.title,
                     "description": self.description,
                     "agency_request_summary": self.agency_request_summary,
@@ -1051,14 +1052,18 @@ class Requests(db.Model):
                     "request_type": [metadata["form_name"] for metadata in self.custom_metadata.values()],
                 },
             )
+            invalidate_search_cache()
 
     def es_delete(self):
         """ Delete a document from the elastic search index """
+        from app.search.utils import invalidate_search_cache
+
         if current_app.config["ELASTICSEARCH_ENABLED"]:
             es.delete(
                 index=current_app.config["ELASTICSEARCH_INDEX"],
                 id=self.id,
             )
+            invalidate_search_cache()
 
     def __repr__(self):
         return "<Requests %r>" % self.id
@@ -1091,6 +1096,10 @@ class Events(db.Model):
 
     __table_args__ = (
         db.ForeignKeyConstraint([user_guid], [Users.guid], onupdate="CASCADE"),
+        # request history (app.request.api.views.get_request_events)
+        db.Index("ix_events_request_id_type_timestamp", request_id, type, timestamp),
+        # events of a user by guid (app.auth.utils._update_user_data)
+        db.Index("ix_events_new_value_user_guid", new_value["user_guid"].astext),
     )
 
     response = db.relationship("Responses", backref="events")
@@ -1122,8 +1131,20 @@ class Events(db.Model):
 
     @property
     def affected_user(self):
+        return self.get_affected_user()
+
+    def get_affected_user(self, users=None):
+        """
+        Returns the user affected by this event, if any.
+
+        :param users: dictionary of guid to Users already loaded (e.g. for a page of events);
+                      the user is queried if not included
+        """
         if self.new_value is not None and "user_guid" in self.new_value:
-            return Users.query.filter_by(guid=self.new_value["user_guid"]).one()
+            guid = self.new_value["user_guid"]
+            if users and guid in users:
+                return users[guid]
+            return Users.query.filter_by(guid=guid).one()
 
     class RowContent(object):
         def __init__(
@@ -1162,20 +1183,29 @@ class Events(db.Model):
         Returns html safe string for use in the rows of the history section,
         or None if this event is not intended for display purposes.
         """
+        return self.get_history_row_content()
+
+    def get_history_row_content(self, affected_users=None):
+        """
+        See history_row_content.
+
+        :param affected_users: dictionary of guid to Users (see get_affected_user)
+        """
         if self.type == event_type.REQ_STATUS_CHANGED:
             return "This request's status was <strong>changed</strong> to:<br>{}".format(
                 self.new_value["status"]
             )
 
+        affected_user = self.get_affected_user(affected_users)
         valid_types = {
             event_type.USER_ADDED: self.RowContent(
-                self, "added", "{} user: {}.", self.affected_user, "User {}: {}."
+                self, "added", "{} user: {}.", affected_user, "User {}: {}."
             ),
             event_type.USER_REMOVED: self.RowContent(
-                self, "removed", "{} user: {}.", self.affected_user
+                self, "removed", "{} user: {}.", affected_user
             ),
             event_type.USER_PERM_CHANGED: self.RowContent(
-                self, "changed", "{} permssions for user: {}.", self.affected_user
+                self, "changed", "{} permssions for user: {}.", affected_user
             ),
             event_type.REQUESTER_INFO_EDITED: self.RowContent(
                 self, "changed", "{} the requester's information."
@@ -1303,6 +1333,16 @@ class Responses(db.Model):
     is_dataset = db.Column(db.Boolean, default=False, nullable=False)
     dataset_description = db.Column(db.String(200), nullable=True)
 
+    __table_args__ = (
+        # responses of a request (app.request.api.views.get_request_responses)
+        db.Index(
+            "ix_responses_request_id_date_modified",
+            request_id,
+            date_modified,
+            postgresql_where=~deleted,
+        ),
+    )
+
     __mapper_args__ = {"polymorphic_on": type}
 
     # TODO: overwrite filter to automatically check if deleted=False
@@ -1484,6 +1524,8 @@ class UserRequests(db.Model):
 
     __table_args__ = (
         db.ForeignKeyConstraint([user_guid], [Users.guid], onupdate="CASCADE"),
+        # the primary key leads with user_guid, so lookups by request need their own index
+        db.Index("ix_user_requests_request_id_point_of_contact", request_id, point_of_contact),
     )
 
     @property
@@ -1551,6 +1593,10 @@ class ResponseTokens(db.Model):
     token = db.Column(db.String, nullable=False)
     response_id = db.Column(db.Integer, db.ForeignKey("responses.id"), nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_response_tokens_token_response_id", token, response_id),
+    )
+
     response = db.relationship("Responses", backref=db.backref("token", uselist=False))
 
     def __init__(self, response_id):
@@ -2094,3 +2140,82 @@ class MFA(db.Model):
         self.secret = secret
         self.device_name = device_name
         self.is_valid = is_valid
+
+
+@event.listens_for(Requests, "expire")
+def _clear_requests_memoized(target, attrs):
+    """ Memoized Requests properties are cleared whenever the request is expired (e.g. on commit). """
+    clear_memoized(target)
+
+
+@event.listens_for(Determinations, "after_insert", propagate=True)
+def _clear_determination_request_memoized(mapper, connection, target):
+    """ Memoized Requests properties depend on the request's determinations. """
+    session = object_session(target)
+    request = session.identity_map.get(session.identity_key(Requests, target.request_id))
+    if request is not None:
+        clear_memoized(request)
+
+
+@event.listens_for(UserRequests, "after_insert")
+@event.listens_for(UserRequests, "after_update")
+@event.listens_for(UserRequests, "after_delete")
+def _clear_user_requests_permissions_masks(mapper, connection, target):
+    """ Permissions cached by app.lib.permission_utils.get_permissions_mask depend on user requests. """
+    from app.lib.permission_utils import clear_permissions_masks
+    clear_permissions_masks()
+
+
+def mark_principals_changed(session, guids):
+    """
+    Invalidate the snapshots of users cached by app.auth.utils.user_loader
+    once the session's transaction is committed.
+
+    Invalidating at commit (rather than at flush) keeps a snapshot of the
+    uncommitted user from being cached by a concurrent HTTP request.
+
+    :param session: session in which the users were changed
+    :param guids: guids of the changed users
+    """
+    session.info.setdefault("changed_principals", set()).update(guids)
+
+
+@event.listens_for(Users, "expire")
+def _clear_users_memoized(target, attrs):
+    """ Memoized Users properties are cleared whenever the user is expired (e.g. on commit). """
+    clear_memoized(target)
+
+
+@event.listens_for(Users, "after_update")
+def _mark_user_principal_changed(mapper, connection, target):
+    mark_principals_changed(object_session(target), [target.guid])
+
+
+@event.listens_for(AgencyUsers, "after_insert")
+@event.listens_for(AgencyUsers, "after_update")
+@event.listens_for(AgencyUsers, "after_delete")
+@event.listens_for(MFA, "after_insert")
+@event.listens_for(MFA, "after_update")
+@event.listens_for(MFA, "after_delete")
+def _mark_user_attributes_changed(mapper, connection, target):
+    """ The agency flags and MFA status of a user are memoized and part of the user's snapshot. """
+    session = object_session(target)
+    user = session.identity_map.get(session.identity_key(Users, target.user_guid))
+    if user is not None:
+        clear_memoized(user)
+    mark_principals_changed(session, [target.user_guid])
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_principals(session):
+    guids = session.info.pop("changed_principals", None)
+    if guids:
+        pipe = store.pipeline(transaction=False)
+        for guid in guids:
+            pipe.incr(PRINCIPAL_VERSION_KEY.format(guid=guid))
+        pipe.execute()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_principals(session):
+    session.info.pop("changed_principals", None)
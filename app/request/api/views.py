@@ -12,7 +12,8 @@ from flask import (
     request as flask_request,
 )
 from flask_login import current_user, login_required
-from sqlalchemy import desc
+from sqlalchemy import desc, func, tuple_
+from sqlalchemy.orm import joinedload
 
 from app.constants import RESPONSES_INCREMENT, EVENTS_INCREMENT
 from app.constants import (
@@ -28,7 +29,7 @@ from app.lib.permission_utils import (
     get_permission
 )
 from app.lib.utils import eval_request_bool
-from app.models import CommunicationMethods, Requests, Responses, Events
+from app.models import CommunicationMethods, Requests, Responses, Events, Users
 from app.permissions.utils import get_permissions_as_list
 from app.request.api import request_api_blueprint
 from app.request.api.utils import create_request_info_event
@@ -110,23 +111,55 @@ def get_request_events():
     Returns a set of events (id, type, and template),
     ordered by date descending, and starting from a specific index.
 
+    Events are paginated with a (timestamp, id) cursor so that loading
+    more events does not load the request's entire history.
+
     Request parameters:
-    - start: (int) starting index
+    - start: (int) starting index, used to number the rows
+    - cursor: (optional) "next_cursor" returned with the previous set of events;
+        if omitted, the first 'start' events are skipped
     - request_id: FOIL request id
     - with_template: (default: False) include html rows for each event
     """
-    start = int(flask_request.args['start'])
+    start = int(flask_request.args.get('start', 0))
+    cursor = flask_request.args.get('cursor')
+    with_template = eval_request_bool(flask_request.args.get('with_template'))
 
     current_request = Requests.query.filter_by(id=flask_request.args['request_id']).one()
 
-    events = Events.query.filter(
+    query = Events.query.filter(
         Events.request_id == current_request.id,
         Events.type.in_(event_type.FOR_REQUEST_HISTORY)
+    )
+    total = query.with_entities(func.count(Events.id)).scalar()
+
+    events = query.options(
+        joinedload(Events.user)
     ).order_by(
-        desc(Events.timestamp)
-    ).all()
-    total = len(events)
-    events = events[start: start + EVENTS_INCREMENT]
+        desc(Events.timestamp),
+        desc(Events.id)
+    )
+    if cursor:
+        timestamp, id_ = cursor.rsplit(',', 1)
+        events = events.filter(
+            tuple_(Events.timestamp, Events.id) < (datetime.fromisoformat(timestamp), int(id_))
+        )
+    else:
+        events = events.offset(start)
+    events = events.limit(EVENTS_INCREMENT).all()
+
+    next_cursor = None
+    if len(events) == EVENTS_INCREMENT:
+        next_cursor = '{},{}'.format(events[-1].timestamp.isoformat(), events[-1].id)
+
+    # users affected by the events are loaded in one query (see Events.get_affected_user)
+    affected_user_guids = {
+        event.new_value['user_guid'] for event in events
+        if with_template and event.new_value is not None and 'user_guid' in event.new_value
+    }
+    affected_users = {
+        user.guid: user for user in Users.query.filter(Users.guid.in_(affected_user_guids))
+    } if affected_user_guids else {}
 
     template_path = 'request/events/'
     event_jsons = []
@@ -150,13 +183,14 @@ def get_request_events():
             'type': event.type
         }
 
-        if eval_request_bool(flask_request.args.get('with_template')):
+        if with_template:
             has_modal = event.type in types_with_modal
             row = render_template(
                 template_path + 'row.html',
                 event=event,
                 row_num=start + i + 1,
-                has_modal=has_modal
+                has_modal=has_modal,
+                affected_users=affected_users
             )
             if has_modal:
                 if event.type == event_type.USER_PERM_CHANGED:
@@ -174,6 +208,7 @@ def get_request_events():
                                 template_path, event.type.lower()
                             ),
                             event=event,
+                            affected_users=affected_users,
                             permissions_granted=list(new_permissions - previous_permissions),
                             permissions_revoked=list(previous_permissions - new_permissions),
                         ),
@@ -195,7 +230,7 @@ def get_request_events():
 
         event_jsons.append(json)
 
-    return jsonify(events=event_jsons, total=total)
+    return jsonify(events=event_jsons, total=total, next_cursor=next_cursor)
 
 
 @request_api_blueprint.route('/responses', methods=['GET'])
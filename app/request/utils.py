@@ -20,11 +20,14 @@ from flask import (
     escape
 )
 from flask_login import current_user
+from sqlalchemy import literal, update
+from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.utils import secure_filename
 
 import app.lib.file_utils as fu
-from app import upload_redis, sentry
+from app import db, upload_redis, sentry
 from app.constants import (
+    bulk_updates,
     event_type,
     role_name as role,
     ACKNOWLEDGMENT_PERIOD_LENGTH,
@@ -36,7 +39,7 @@ from app.constants.response_privacy import (
     PRIVATE
 )
 from app.constants.submission_methods import DIRECT_INPUT
-from app.lib.db_utils import create_object, update_object
+from app.lib.db_utils import create_object
 from app.lib.email_utils import (
     get_assigned_users_emails,
     send_contact_email
@@ -138,6 +141,13 @@ def create_request(title,
     date_created = local_to_utc(date_created_local, tz_name)
     date_submitted = local_to_utc(date_submitted_local, tz_name)
 
+    # The request and everything created along with it is flushed and committed
+    # once; Events and UserRequests are bulk inserted.
+    events = []
+    user_requests = []
+    # permissions of each role, loaded once
+    role_permissions = dict(db.session.query(Roles.name, Roles.permissions))
+
     # 5. Create Request
     request = Requests(
         id=request_id,
@@ -151,7 +161,7 @@ def create_request(title,
         submission=submission,
         custom_metadata=custom_metadata
     )
-    create_object(request)
+    db.session.add(request)
 
     guid_for_event = current_user.guid if not current_user.is_anonymous else None
 
@@ -173,12 +183,12 @@ def create_request(title,
             mailing_address=address,
             is_anonymous_requester=True
         )
-        create_object(user)
+        db.session.add(user)
         # user created event
-        create_object(Events(
-            request_id,
-            guid_for_event,
-            event_type.USER_CREATED,
+        events.append(bulk_updates.EventsDict(
+            request_id=request_id,
+            user_guid=guid_for_event,
+            type=event_type.USER_CREATED,
             previous_value=None,
             new_value=user.val_for_events,
             response_id=None,
@@ -186,13 +196,12 @@ def create_request(title,
         ))
 
     if upload_path is not None:
-        # Store file metadata
-        file_mimetype = fu.get_mime_type(upload_path)
-        file_size = fu.getsize(upload_path)
-        file_hash = fu.get_hash(upload_path)
+        with fu.sftp_batch():
+            # Store file metadata
+            file_size, file_mimetype, file_hash = fu.get_file_metadata(upload_path)
 
-        # 7. Move file to upload directory
-        upload_path = _move_validated_upload(request_id, upload_path)
+            # 7. Move file to upload directory
+            upload_path = _move_validated_upload(request_id, upload_path)
         # 8. Create response object
         filename = os.path.basename(upload_path)
         response = Files(request_id,
@@ -203,20 +212,22 @@ def create_request(title,
                          file_size,
                          file_hash,
                          is_editable=False)
-        create_object(obj=response)
+        db.session.add(response)
+        db.session.flush()  # for response.id
 
         # 8. Create upload Event
-        upload_event = Events(user_guid=user.guid,
-                              response_id=response.id,
-                              request_id=request_id,
-                              type_=event_type.FILE_ADDED,
-                              timestamp=datetime.utcnow(),
-                              new_value=response.val_for_events)
-        create_object(upload_event)
+        events.append(bulk_updates.EventsDict(
+            user_guid=user.guid,
+            response_id=response.id,
+            request_id=request_id,
+            type=event_type.FILE_ADDED,
+            timestamp=datetime.utcnow(),
+            new_value=response.val_for_events
+        ))
 
         # Create response token if requester is anonymous
         if current_user.is_anonymous or current_user.is_agency:
-            create_object(ResponseTokens(response.id))
+            db.session.add(ResponseTokens(response.id))
 
     role_to_user = {
         role.PUBLIC_REQUESTER: user.is_public,
@@ -227,35 +238,29 @@ def create_request(title,
 
     # 9. Create Event
     timestamp = datetime.utcnow()
-    event = Events(user_guid=user.guid if current_user.is_anonymous else current_user.guid,
-                   request_id=request_id,
-                   type_=event_type.REQ_CREATED,
-                   timestamp=timestamp,
-                   new_value=request.val_for_events)
-    create_object(event)
+    events.append(bulk_updates.EventsDict(
+        user_guid=user.guid if current_user.is_anonymous else current_user.guid,
+        request_id=request_id,
+        type=event_type.REQ_CREATED,
+        timestamp=timestamp,
+        new_value=request.val_for_events
+    ))
     if current_user.is_agency:
-        agency_event = Events(user_guid=current_user.guid,
-                              request_id=request.id,
-                              type_=event_type.AGENCY_REQ_CREATED,
-                              timestamp=timestamp)
-        create_object(agency_event)
+        events.append(bulk_updates.EventsDict(
+            user_guid=current_user.guid,
+            request_id=request_id,
+            type=event_type.AGENCY_REQ_CREATED,
+            timestamp=timestamp
+        ))
 
     # 10. Create UserRequest for requester
-    user_request = UserRequests(user_guid=user.guid,
-                                request_user_type=user_type_request.REQUESTER,
-                                request_id=request_id,
-                                permissions=Roles.query.filter_by(
-                                    name=role_name).first().permissions)
-    create_object(user_request)
-    create_object(Events(
-        request_id,
-        guid_for_event,
-        event_type.USER_ADDED,
-        previous_value=None,
-        new_value=user_request.val_for_events,
-        response_id=None,
-        timestamp=datetime.utcnow()
-    ))
+    _add_user_request(user_requests,
+                      events,
+                      request_id=request_id,
+                      user_guid=user.guid,
+                      request_user_type=user_type_request.REQUESTER,
+                      permissions=role_permissions[role_name],
+                      guid_for_event=guid_for_event)
 
     # 11. Create the elasticsearch request doc only if agency has been onboarded
     agency = Agencies.query.filter_by(ein=agency_ein).one()
@@ -264,8 +269,11 @@ def create_request(title,
     if agency.administrators:
         # b. Store all agency users objects in the UserRequests table as Agency users with Agency Administrator
         # privileges
-        _create_agency_user_requests(request_id=request_id,
+        _create_agency_user_requests(user_requests,
+                                     events,
+                                     request_id=request_id,
                                      agency_admins=agency.administrators,
+                                     permissions=role_permissions[role.AGENCY_ADMIN],
                                      guid_for_event=guid_for_event)
 
     # 13. Add all parent agency administrators to the request.
@@ -276,10 +284,25 @@ def create_request(title,
                 agency.parent.is_active and
                 agency.parent.administrators
         ):
-            _create_agency_user_requests(request_id=request_id,
+            _create_agency_user_requests(user_requests,
+                                         events,
+                                         request_id=request_id,
                                          agency_admins=agency.parent.administrators,
+                                         permissions=role_permissions[role.AGENCY_ADMIN],
                                          guid_for_event=guid_for_event)
 
+    try:
+        # bulk inserts do not flush pending objects (the request and user they reference)
+        db.session.flush()
+        db.session.bulk_insert_mappings(UserRequests, user_requests)
+        db.session.bulk_insert_mappings(Events, events)
+        db.session.commit()
+    except SQLAlchemyError:
+        sentry.captureException()
+        db.session.rollback()
+        current_app.logger.exception("Failed to CREATE {}".format(request))
+        raise
+
     # (Now that we can associate the request with its requester AND agency users.)
     if current_app.config['ELASTICSEARCH_ENABLED'] and agency.is_active:
         request.es_create()
@@ -394,28 +417,56 @@ def generate_request_id(agency_ein):
     """
     Generates an agency-specific FOIL request id.
 
+    Request numbers are allocated from the parent agency's next_request_number
+    (parent agencies handle the request counting, not sub-agencies) with a single
+    UPDATE ... RETURNING, so concurrent submissions never receive the same number.
+    The allocation is committed immediately; numbers of requests that fail to be
+    created are skipped, as with a sequence.
+
     :param agency_ein: agency_ein ein used to generate the request_id
     :return: generated FOIL Request ID (FOIL - year - agency ein - 5 digits for request number)
     """
     if agency_ein:
-        agency = Agencies.query.filter_by(
-            ein=agency_ein).one()  # This is the actual agency (including sub-agencies)
-        next_request_number = Agencies.query.filter_by(
-            ein=agency.formatted_parent_ein).one().next_request_number  # Parent agencies handle the request counting, not sub-agencies
-        agency_ein = agency.parent_ein
-        request_id = "FOIL-{0:s}-{1!s}-{2:05d}".format(
-            datetime.utcnow().strftime("%Y"), agency_ein, int(next_request_number))
-        if Requests.query.filter_by(id=request_id).one_or_none():
-            update_object(
-                {'next_request_number': next_request_number + 1},
-                Agencies,
-                agency.ein
-            )
-            request_id = generate_request_id(agency.ein)
-        return request_id
+        while True:
+            request_number, parent_ein = _allocate_request_number(agency_ein)
+            request_id = "FOIL-{0:s}-{1!s}-{2:05d}".format(
+                datetime.utcnow().strftime("%Y"), parent_ein, int(request_number))
+            # numbers allocated around the yearly reset (app.jobs.update_next_request_number)
+            # can belong to existing requests
+            if not db.session.query(Requests.query.filter_by(id=request_id).exists()).scalar():
+                return request_id
     return None
 
 
+def _allocate_request_number(agency_ein):
+    """
+    Atomically allocate the next request number of an agency's parent agency.
+
+    :param agency_ein: ein of the (sub-)agency the request is for
+    :return: tuple of the allocated request number and the parent ein (as used in request ids)
+    """
+    parent = Agencies.__table__
+    agency = parent.alias("agency")
+    try:
+        request_number, parent_ein = db.session.execute(
+            update(parent).where(
+                agency.c.ein == agency_ein,
+                # formatted_parent_ein
+                parent.c.ein == literal("0") + agency.c.parent_ein,
+            ).values(
+                next_request_number=parent.c.next_request_number + 1
+            ).returning(
+                parent.c.next_request_number - 1,
+                agency.c.parent_ein,
+            )
+        ).one()
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    return request_number, parent_ein
+
+
 def generate_email_template(template_name, **kwargs):
     """
     Generate HTML for rich-text emails.
@@ -526,31 +577,66 @@ def send_confirmation_email(request, agency, user):
         print("Error:", e)
 
 
-def _create_agency_user_requests(request_id, agency_admins, guid_for_event):
+def _create_agency_user_requests(user_requests, events, request_id, agency_admins, permissions, guid_for_event):
     """
-    Creates user_requests entries for agency administrators.
+    Adds user_requests entries (and their events) for agency administrators to be bulk inserted.
+    Administrators already added to the request (e.g. administrators of both an agency and
+    its monitoring parent agency) are skipped.
+    :param user_requests: list of UserRequestsDict to add to
+    :param events: list of EventsDict to add to
     :param request_id: Request being created
-    :param agency_users: List of Users
+    :param agency_admins: List of Users
+    :param permissions: Agency Administrator permissions
     :param guid_for_event: guid used to create request events
     :return:
     """
-
+    added_guids = {user_request['user_guid'] for user_request in user_requests}
     for admin in agency_admins:
-        user_request = UserRequests(user_guid=admin.guid,
-                                    request_user_type=user_type_request.AGENCY,
-                                    request_id=request_id,
-                                    permissions=Roles.query.filter_by(
-                                        name=role.AGENCY_ADMIN).first().permissions)
-        create_object(user_request)
-        create_object(Events(
-            request_id,
-            guid_for_event,
-            event_type.USER_ADDED,
-            previous_value=None,
-            new_value=user_request.val_for_events,
-            response_id=None,
-            timestamp=datetime.utcnow()
-        ))
+        if admin.guid in added_guids:
+            continue
+        added_guids.add(admin.guid)
+        _add_user_request(user_requests,
+                          events,
+                          request_id=request_id,
+                          user_guid=admin.guid,
+                          request_user_type=user_type_request.AGENCY,
+                          permissions=permissions,
+                          guid_for_event=guid_for_event)
+
+
+def _add_user_request(user_requests, events, request_id, user_guid, request_user_type, permissions, guid_for_event):
+    """
+    Adds a user_requests entry and its USER_ADDED event to be bulk inserted.
+    :param user_requests: list of UserRequestsDict to add to
+    :param events: list of EventsDict to add to
+    :param request_id: Request being created
+    :param user_guid: guid of the user added to the request
+    :param request_user_type: requester or agency
+    :param permissions: permissions of the user on the request
+    :param guid_for_event: guid used to create request events
+    :return:
+    """
+    user_request = bulk_updates.UserRequestsDict(user_guid=user_guid,
+                                                 request_user_type=request_user_type,
+                                                 request_id=request_id,
+                                                 permissions=permissions,
+                                                 point_of_contact=None)
+    user_requests.append(user_request)
+    # same as UserRequests.val_for_events
+    events.append(bulk_updates.EventsDict(
+        request_id=request_id,
+        user_guid=guid_for_event,
+        type=event_type.USER_ADDED,
+        previous_value=None,
+        new_value={
+            "user_guid": user_guid,
+            "request_user_type": request_user_type,
+            "permissions": permissions,
+            "point_of_contact": None,
+        },
+        response_id=None,
+        timestamp=datetime.utcnow()
+    ))
 
 
 def create_contact_record(request, first_name, last_name, email, subject, message):
@@ -20,13 +20,13 @@ from flask import (
 )
 from flask_login import current_user
 from sqlalchemy import any_
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
-from app.constants import request_status, permission, HIDDEN_AGENCIES
+from app.constants import request_status, permission, user_type_request, HIDDEN_AGENCIES
 from app.lib.date_utils import DEFAULT_YEARS_HOLIDAY_LIST, get_holidays_date_list
-from app.lib.permission_utils import is_allowed
 from app.lib.utils import InvalidUserException, eval_request_bool
-from app.models import Requests, Agencies, UserRequests
+from app.models import Requests, Agencies, AgencyUsers, UserRequests, Users
 from app.request import request
 from app.request.forms import (
     PublicUserRequestForm,
@@ -57,8 +57,7 @@ from app.user_request.forms import (
     EditUserRequestForm,
     RemoveUserRequestForm,
 )
-from app.user_request.utils import get_current_point_of_contact
-from app import sentry
+from app import db, sentry
 import json
 
 
@@ -251,15 +250,31 @@ def view(request_id):
         )
     )
 
+    # The users of the request (with their permissions) are loaded in one query
+    # and the agency's users (with their flags) in another; everything below is
+    # derived from them in memory.
+    user_requests = {
+        user_request.user_guid: user_request
+        for user_request in current_request.user_requests.options(joinedload(UserRequests.user))
+    }
+
     active_users = []
     assigned_users = []
     if current_user.is_agency:
-        for agency_user in current_request.agency.active_users:
-            if agency_user not in current_request.agency_administrators and (
-                agency_user != current_user
-            ) and not agency_user.is_agency_read_only(current_request.agency_ein):
+        agency_users = db.session.query(
+            Users, AgencyUsers.is_agency_admin
+        ).join(
+            AgencyUsers, AgencyUsers.user_guid == Users.guid
+        ).filter(
+            AgencyUsers.agency_ein == current_request.agency_ein,
+            AgencyUsers.is_agency_active == True,  # noqa: E712
+            AgencyUsers.is_read_only.isnot(True),
+        ).all()
+        for agency_user, is_agency_admin in agency_users:
+            if not is_agency_admin and agency_user != current_user:
+                user_request = user_requests.get(agency_user.guid)
                 # populate list of assigned users that can be removed from a request
-                if agency_user in current_request.agency_users:
+                if user_request is not None and user_request.request_user_type == user_type_request.AGENCY:
                     assigned_users.append(agency_user)
                 # append to list of active users that can be added to a request
                 else:
@@ -295,31 +310,18 @@ def view(request_id):
     }
 
     # Build permissions dictionary for checking on the front-end.
+    current_user_request = None if current_user.is_anonymous else user_requests.get(current_user.guid)
     for key, val in permissions.items():
-        if (
-            current_user.is_anonymous
-            or not current_request.user_requests.filter_by(
-                user_guid=current_user.guid
-            ).first()
-        ):
-            permissions[key] = False
-        else:
-            permissions[key] = (
-                is_allowed(current_user, request_id, val)
-                if not current_user.is_anonymous
-                else False
-            )
+        permissions[key] = current_user_request is not None and current_user_request.has_permission(val)
 
     # Build dictionary of current permissions for all assigned users.
-    assigned_user_permissions = {}
-    for u in assigned_users:
-        assigned_user_permissions[u.guid] = (
-            UserRequests.query.filter_by(request_id=request_id, user_guid=u.guid)
-            .one()
-            .get_permission_choice_indices()
-        )
+    assigned_user_permissions = {
+        u.guid: user_requests[u.guid].get_permission_choice_indices() for u in assigned_users
+    }
 
-    point_of_contact = get_current_point_of_contact(request_id)
+    point_of_contact = next(
+        (user_request for user_request in user_requests.values() if user_request.point_of_contact), None
+    )
     if point_of_contact:
         current_point_of_contact = {"user_guid": point_of_contact.user_guid}
     else:
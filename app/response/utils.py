@@ -6,6 +6,7 @@
 
 """
 import json
+from collections import namedtuple
 from datetime import datetime
 from urllib.parse import urljoin, urlencode
 from lxml.html.clean import clean_html
@@ -91,6 +92,9 @@ from app.models import (
 from app.request.api.utils import create_request_info_event
 from app.upload.utils import complete_upload
 
+# What letter templates use of a request's acknowledgment (see Requests.date_acknowledged)
+Acknowledgement = namedtuple('Acknowledgement', ['date_modified'])
+
 # TODO: class ResponseProducer()
 
 def add_file(request_id, filename, title, privacy, is_dataset, dataset_description, is_editable):
@@ -111,9 +115,7 @@ def add_file(request_id, filename, title, privacy, is_dataset, dataset_descripti
         size, mime_type, hash_ = redis_get_file_metadata(request_id, path)
         redis_delete_file_metadata(request_id, path)
     except AttributeError:
-        size = fu.getsize(path)
-        mime_type = fu.get_mime_type(path)
-        hash_ = fu.get_hash(path)
+        size, mime_type, hash_ = fu.get_file_metadata(path)
         sentry.captureException()
 
     try:
@@ -203,7 +205,8 @@ def add_acknowledgment(request_id, info, days, date, tz_name, content, method, l
         new_due_date = _get_new_due_date(request_id, days, date, tz_name)
         update_object(
             {'due_date': new_due_date,
-             'status': request_status.IN_PROGRESS},
+             'status': request_status.IN_PROGRESS,
+             'date_acknowledged': datetime.utcnow()},
             Requests,
             request_id
         )
@@ -269,7 +272,8 @@ def add_denial(request_id, reason_ids, content, method, letter_template_id):
     if request.status != request_status.CLOSED:
         previous_status = request.status
         previous_date_closed = request.date_closed.isoformat() if request.date_closed else None
-        update_vals = {'status': request_status.CLOSED}
+        update_vals = {'status': request_status.CLOSED,
+                       'date_last_closed': datetime.utcnow()}
         if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
             update_vals['date_closed'] = get_next_business_day()
         else:
@@ -368,7 +372,8 @@ def add_closing(request_id, reason_ids, content, method, letter_template_id):
             request.was_acknowledged or request.was_reopened):
         previous_status = request.status
         previous_date_closed = request.date_closed.isoformat() if request.date_closed else None
-        update_vals = {'status': request_status.CLOSED}
+        update_vals = {'status': request_status.CLOSED,
+                       'date_last_closed': datetime.utcnow()}
         if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
             update_vals['date_closed'] = get_next_business_day()
         else:
@@ -470,7 +475,8 @@ def add_quick_closing(request_id, days, date, tz_name, content):
         new_due_date = _get_new_due_date(request_id, days, date, tz_name)
         update_object(
             {'due_date': new_due_date,
-             'status': request_status.IN_PROGRESS},
+             'status': request_status.IN_PROGRESS,
+             'date_acknowledged': datetime.utcnow()},
             Requests,
             request_id
         )
@@ -500,7 +506,8 @@ def add_quick_closing(request_id, days, date, tz_name, content):
             request.was_acknowledged or request.was_reopened):
         previous_status = request.status
         previous_date_closed = request.date_closed.isoformat() if request.date_closed else None
-        update_vals = {'status': request_status.CLOSED}
+        update_vals = {'status': request_status.CLOSED,
+                       'date_last_closed': datetime.utcnow()}
         if not calendar.isbusday(datetime.utcnow()) or datetime.utcnow().date() < request.date_submitted.date():
             update_vals['date_closed'] = get_next_business_day()
         else:
@@ -595,7 +602,8 @@ def add_reopening(request_id, date, tz_name, content, reason, method, letter_tem
         update_object(
             {'status': request_status.IN_PROGRESS,
              'due_date': new_due_date,
-             'agency_request_summary_release_date': None},
+             'agency_request_summary_release_date': None,
+             'reopen_count': Requests.reopen_count + 1},
             Requests,
             request_id
         )
@@ -1216,8 +1224,8 @@ def _extension_letter_handler(request_id, data):
 
         point_of_contact_user = assign_point_of_contact(extension.get('point_of_contact', None))
 
-        acknowledgement = request.responses.join(Determinations).filter(
-            Determinations.dtype == determination_type.ACKNOWLEDGMENT).one_or_none()
+        acknowledgement = (Acknowledgement(date_modified=request.date_acknowledged)
+                           if request.date_acknowledged is not None else None)
         due_date = _get_new_due_date(request_id, extension['length'], extension['custom_due_date'], data['tz_name'])
 
         template = render_template_string(contents.content,
@@ -2872,9 +2880,7 @@ class RespFileEditor(ResponseEditor):
                             filepath,
                             is_update=True)
                     except AttributeError:
-                        size = fu.getsize(filepath)
-                        mime_type = fu.get_mime_type(filepath)
-                        hash_ = fu.get_hash(filepath)
+                        size, mime_type, hash_ = fu.get_file_metadata(filepath)
                         sentry.captureException()
                     self.set_data_values('size',
                                          self.response.size,
@@ -18,7 +18,6 @@ from flask import (
     redirect,
     jsonify,
     current_app,
-    after_this_request,
     abort,
     send_file
 )
@@ -722,23 +721,13 @@ def get_response_content(response_id):
             response_.name
         )
         filepath = os.path.join(*filepath_parts)
-        serving_path = os.path.join(
-            current_app.config['UPLOAD_SERVING_DIRECTORY'],
-            response_.request_id,
-            response_.name
-        )
         token = flask_request.args.get('token')
         if current_app.config['USE_VOLUME_STORAGE'] and not fu.exists(filepath):
             return abort(403)
 
         if response_.is_public:
             # then we just serve the file, anyone can view it
-            @after_this_request
-            def remove(resp):
-                if current_app.config['USE_VOLUME_STORAGE']:
-                    os.remove(serving_path)
-                return resp
-            return fu.send_file(*filepath_parts, as_attachment=True)
+            return fu.send_file(*filepath_parts, etag=response_.hash, as_attachment=True)
         else:
             # check presence of token in url
             if token is not None:
@@ -746,13 +735,7 @@ def get_response_content(response_id):
                     token=token, response_id=response_id).first()
                 if resptok is not None:
                     if response_.privacy != PRIVATE:
-                        @after_this_request
-                        def remove(resp):
-                            if current_app.config['USE_VOLUME_STORAGE']:
-                                os.remove(serving_path)
-                            return resp
-
-                        return fu.send_file(*filepath_parts, as_attachment=True)
+                        return fu.send_file(*filepath_parts, etag=response_.hash, as_attachment=True)
                     else:
                         delete_object(resptok)
 
@@ -766,13 +749,7 @@ def get_response_content(response_id):
                             request_id=response_.request_id,
                             user_guid=current_user.guid
                         ).first() is not None):
-                    @after_this_request
-                    def remove(resp):
-                        if current_app.config['USE_VOLUME_STORAGE']:
-                            os.remove(serving_path)
-                        return resp
-
-                    return fu.send_file(*filepath_parts, as_attachment=True)
+                    return fu.send_file(*filepath_parts, etag=response_.hash, as_attachment=True)
                 # user does not have permission to view file
                 return abort(403)
             else:
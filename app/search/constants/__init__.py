@@ -0,0 +1,47 @@
+DEFAULT_HITS_SIZE = 10
+
+ES_DATE_RANGE_FORMAT = 'MM/dd/yyyy'
+DT_DATE_RANGE_FORMAT = '%m/%d/%Y'
+
+MOCK_EMPTY_ELASTICSEARCH_RESULT = {
+    "hits": {
+        "total": 0,
+        "hits": []
+    }
+}
+
+ALL_RESULTS_CHUNKSIZE = 1000
+
+# redis sorted set of request ids waiting to be synced to elasticsearch,
+# scored by the time each request was first queued
+ES_SYNC_QUEUE_KEY = 'es_sync:requests'
+
+# cached results of searches that do not depend on the current user
+SEARCH_CACHE_KEY = 'search:{generation}:{query_hash}'
+# incremented on every index write to invalidate all cached results
+SEARCH_CACHE_GENERATION_KEY = 'search:generation'
+# rendered search result rows (see app.search.utils.render_result_rows)
+SEARCH_ROW_CACHE_KEY = 'search:row:{index}:{request_id}:{version}:{user_class}'
+
+# date fields of request docs converted by app.search.utils.convert_dates
+ES_DATE_FIELDS = ('date_submitted', 'date_due', 'date_received', 'date_closed')
+
+# number of requests loaded from the database at a time when (re)indexing
+REINDEX_PAGE_SIZE = 1000
+
+# lengths of the ngrams of FOIL IDs indexed for partial FOIL ID lookups,
+# from 3 up to that of a full FOIL ID ("foil-2019-002-00001")
+FOIL_ID_MIN_GRAM = 3
+FOIL_ID_MAX_GRAM = 19
+
+MAX_RESULT_SIZE = 50
+
+# Background search result-set exports
+EXPORT_DIRNAME = 'exports'  # directory within UPLOAD_DIRECTORY
+EXPORT_KEY = 'export:{export_id}'
+EXPORT_DEDUP_KEY = 'export:{user_guid}:{query_hash}'
+EXPORT_FILES_KEY = 'exports:files'  # sorted set of stored export paths scored by time created
+EXPORT_TTL = 60 * 60 * 24  # seconds
+# request parameters that do not affect the contents of an export
+EXPORT_IGNORED_ARGS = ('async_export', 'gzip', 'start', 'size')
+
@@ -0,0 +1,3 @@
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
@@ -1,32 +1,114 @@
+import csv
+import gzip
+import json
+import os
 from datetime import datetime
+from hashlib import sha1
+from io import StringIO
+from time import perf_counter, time
+from uuid import uuid4
 
-from elasticsearch.helpers import bulk
-from flask import current_app
+from elasticsearch.helpers import bulk, streaming_bulk
+from flask import current_app, Markup, render_template, url_for
 from flask_login import current_user
-from sqlalchemy.orm import joinedload
+from psycopg2 import OperationalError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
 
-from app import es
+import app.lib.file_utils as fu
+from app import celery, db, es, es_sync_redis, search_cache_redis, upload_redis
 from app.constants import ES_DATETIME_FORMAT, request_status
 from app.lib.date_utils import utc_to_local, local_to_utc
-from app.lib.utils import InvalidUserException
-from app.models import Requests, Agencies
+from app.lib.email_utils import send_email
+from app.lib.utils import InvalidUserException, eval_request_bool
+from app.models import Requests, Agencies, Users
 from app.search.constants import (
     MAX_RESULT_SIZE,
+    ALL_RESULTS_CHUNKSIZE,
     ES_DATE_RANGE_FORMAT,
     DT_DATE_RANGE_FORMAT,
     MOCK_EMPTY_ELASTICSEARCH_RESULT,
+    REINDEX_PAGE_SIZE,
+    FOIL_ID_MIN_GRAM,
+    FOIL_ID_MAX_GRAM,
+    ES_SYNC_QUEUE_KEY,
+    EXPORT_DEDUP_KEY,
+    EXPORT_DIRNAME,
+    EXPORT_FILES_KEY,
+    EXPORT_IGNORED_ARGS,
+    EXPORT_KEY,
+    EXPORT_TTL,
+    SEARCH_CACHE_GENERATION_KEY,
+    SEARCH_CACHE_KEY,
+    SEARCH_ROW_CACHE_KEY,
+    ES_DATE_FIELDS,
 )
+from app.search.constants import export_status
 
 
-def recreate():
+def recreate(zero_downtime=False):
     """
     Recreate elasticsearch indices and request docs.
+
+    :param zero_downtime: build a new versioned index and swap the alias
+        over to it once it is populated (see rebuild) instead of deleting
+        the live index first
     """
+    if zero_downtime:
+        rebuild()
+        return
     delete_index()
     create_index()
     create_docs()
 
 
+def rebuild():
+    """
+    Rebuild the request docs without taking search offline.
+
+    A new versioned index ("<ELASTICSEARCH_INDEX>_v<timestamp>") is created
+    with refreshes disabled and no replicas, populated, restored to its
+    default settings and then atomically swapped in behind the
+    ELASTICSEARCH_INDEX alias. Indices previously behind the alias (or a
+    concrete index using the alias name, from before aliases were used)
+    are removed as part of the same swap.
+
+    Note: changes to requests made while the new index is being populated
+    are written to the old index only and will be picked up by the next
+    incremental sync or rebuild.
+    """
+    alias = current_app.config["ELASTICSEARCH_INDEX"]
+    new_index = "{alias}_v{timestamp}".format(
+        alias=alias, timestamp=datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    )
+
+    create_index(
+        index=new_index, settings={"refresh_interval": "-1", "number_of_replicas": 0}
+    )
+    create_docs(index=new_index)
+    # null resets a setting to its default
+    es.indices.put_settings(
+        index=new_index,
+        body={"index": {"refresh_interval": None, "number_of_replicas": None}},
+    )
+    es.indices.refresh(index=new_index)
+
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+    if es.indices.exists_alias(name=alias):
+        actions += [
+            {"remove_index": {"index": index}}
+            for index in es.indices.get_alias(name=alias)
+        ]
+    elif es.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    invalidate_search_cache()
+
+    current_app.logger.info(
+        "Swapped alias {alias} to index {index}.".format(alias=alias, index=new_index)
+    )
+
+
 def index_exists():
     """
     Return whether the elasticsearch index exists or not.
@@ -37,8 +119,13 @@ def index_exists():
 def delete_index():
     """
     Delete all elasticsearch indices, ignoring errors.
+
+    If ELASTICSEARCH_INDEX is an alias, the indices behind it are deleted.
     """
-    es.indices.delete(index=current_app.config["ELASTICSEARCH_INDEX"], ignore=[400, 404])
+    index = current_app.config["ELASTICSEARCH_INDEX"]
+    if es.indices.exists_alias(name=index):
+        index = ",".join(es.indices.get_alias(name=index).keys())
+    es.indices.delete(index=index, ignore=[400, 404])
 
 def delete_doc(request_id):
     """
@@ -47,6 +134,7 @@ def delete_doc(request_id):
     es.delete(index=current_app.config['ELASTICSEARCH_INDEX'],
               doc_type="request",
               id=request_id)
+    invalidate_search_cache()
 
 def delete_docs():
     """
@@ -60,17 +148,52 @@ def delete_docs():
         wait_for_completion=True,
         refresh=True,
     )
+    invalidate_search_cache()
 
 
-def create_index():
+def create_index(index=None, settings=None):
     """
     Create elasticsearch index with mappings for request docs.
+
+    :param index: name of the index to create (defaults to ELASTICSEARCH_INDEX)
+    :param settings: index settings to create the index with
     """
     es.indices.create(
-        index=current_app.config["ELASTICSEARCH_INDEX"],
+        index=index or current_app.config["ELASTICSEARCH_INDEX"],
         body={
+            "settings": {
+                "max_ngram_diff": FOIL_ID_MAX_GRAM - FOIL_ID_MIN_GRAM,
+                "analysis": {
+                    "tokenizer": {
+                        "foil_id_ngram": {
+                            "type": "ngram",
+                            "min_gram": FOIL_ID_MIN_GRAM,
+                            "max_gram": FOIL_ID_MAX_GRAM,
+                        }
+                    },
+                    "analyzer": {
+                        "foil_id_ngram": {
+                            "type": "custom",
+                            "tokenizer": "foil_id_ngram",
+                            "filter": ["lowercase"],
+                        }
+                    },
+                },
+                **(settings or {}),
+            },
             "mappings": {
                 "properties": {
+                    "foil_id": {
+                        "type": "keyword",
+                        "fields": {
+                            # for partial FOIL ID lookups (see RequestsDSLGenerator.foil_id)
+                            "ngram": {
+                                "type": "text",
+                                "analyzer": "foil_id_ngram",
+                                "search_analyzer": "keyword",
+                            }
+                        },
+                    },
                     "title": {
                         "type": "text",
                         "analyzer": "english",
@@ -119,73 +242,225 @@ def create_index():
     )
 
 
-def create_docs():
+def create_docs(index=None):
     """
     Create elasticsearch request docs for every request db record.
+
+    Requests are paged through by primary key (keyset pagination) and bulk
+    actions are generated lazily, so memory usage stays constant regardless
+    of the number of requests being indexed.
+
+    :param index: name of the index to populate (defaults to ELASTICSEARCH_INDEX)
     """
+    agencies = {a.ein: a for a in Agencies.query.filter_by(is_active=True).all()}
 
-    agency_eins = {a.ein: a for a in Agencies.query.filter_by(is_active=True).all()}
+    num_success = 0
+    num_total = 0
+    start_time = perf_counter()
+    for success, _ in streaming_bulk(
+        es,
+        _generate_doc_actions(agencies),
+        index=index or current_app.config["ELASTICSEARCH_INDEX"],
+        chunk_size=current_app.config["ELASTICSEARCH_CHUNK_SIZE"],
+        raise_on_error=True,
+    ):
+        num_total += 1
+        if success:
+            num_success += 1
+    elapsed = perf_counter() - start_time
+    invalidate_search_cache()
 
-    #: :type: collections.Iterable[app.models.Requests]
-    requests = (
-        Requests.query.filter(Requests.agency_ein.in_(agency_eins.keys()))
-        .options(joinedload(Requests.agency_users))
-        .options(joinedload(Requests.requester))
-        .all()
+    current_app.logger.info(
+        "Successfully created {num_success} of {total_num} docs in {elapsed:.2f}s ({rate:.2f} docs/s).".format(
+            num_success=num_success,
+            total_num=num_total,
+            elapsed=elapsed,
+            rate=num_total / elapsed if elapsed else 0,
+        )
     )
-    operations = []
-    for r in requests:
-        date_received = (
-            r.date_created.strftime(ES_DATETIME_FORMAT)
-            if r.date_created < r.date_submitted
-            else r.date_submitted.strftime(ES_DATETIME_FORMAT)
+
+
+def _generate_doc_actions(agencies):
+    """
+    Lazily generate elasticsearch bulk "create" actions for every request
+    belonging to the specified agencies.
+
+    Only one page of requests (REINDEX_PAGE_SIZE rows) is held at a time;
+    previous pages are released once their actions have been consumed.
+
+    :param agencies: dictionary of agency ein to Agencies object
+    """
+    last_id = None
+    while True:
+        query = Requests.query.filter(Requests.agency_ein.in_(agencies.keys()))
+        if last_id is not None:
+            query = query.filter(Requests.id > last_id)
+        #: :type: list[app.models.Requests]
+        requests = (
+            query.options(selectinload(Requests.agency_users))
+            .options(selectinload(Requests.requester))
+            .order_by(Requests.id)
+            .limit(REINDEX_PAGE_SIZE)
+            .all()
         )
-        request_type = []
-        if r.custom_metadata is not None:
-            request_type = [metadata["form_name"] for metadata in r.custom_metadata.values()]
-        operation = {
-            "_op_type": "create",
-            "_id": r.id,
-            "title": r.title,
-            "description": r.description,
-            "agency_request_summary": r.agency_request_summary,
-            "requester_name": r.requester.name,
-            "requester_id": "{guid}".format(guid=r.requester.guid),
-            "title_private": r.privacy["title"],
-            "agency_request_summary_private": not r.agency_request_summary_released,
-            "date_created": r.date_created.strftime(ES_DATETIME_FORMAT),
-            "date_submitted": r.date_submitted.strftime(ES_DATETIME_FORMAT),
-            "date_received": date_received,
-            "date_due": r.due_date.strftime(ES_DATETIME_FORMAT),
-            "submission": r.submission,
-            "status": r.status,
-            "agency_ein": r.agency_ein,
-            "agency_acronym": agency_eins[r.agency_ein].acronym,
-            "agency_name": agency_eins[r.agency_ein].name,
-            "public_title": "Private" if not r.privacy["title"] else r.title,
-            "assigned_users": [
-                "{guid}".format(guid=user.guid) for user in r.agency_users
-            ],
-            "request_type": request_type
-            # public_agency_request_summary
-        }
+        if not requests:
+            break
+        for r in requests:
+            yield _create_doc_action(r, agencies[r.agency_ein])
+        last_id = requests[-1].id
+
+
+def _create_doc_action(r, agency, op_type="create"):
+    """
+    Return the elasticsearch bulk action containing the full doc for a request.
+
+    :param r: Requests object
+    :param agency: Agencies object the request belongs to
+    :param op_type: bulk operation type ("create" or "index")
+    """
+    date_received = (
+        r.date_created.strftime(ES_DATETIME_FORMAT)
+        if r.date_created < r.date_submitted
+        else r.date_submitted.strftime(ES_DATETIME_FORMAT)
+    )
+    request_type = []
+    if r.custom_metadata is not None:
+        request_type = [metadata["form_name"] for metadata in r.custom_metadata.values()]
+    operation = {
+        "_op_type": op_type,
+        "_id": r.id,
+        "foil_id": r.id,
+        "title": r.title,
+        "description": r.description,
+        "agency_request_summary": r.agency_request_summary,
+        "requester_name": r.requester.name,
+        "requester_id": "{guid}".format(guid=r.requester.guid),
+        "title_private": r.privacy["title"],
+        "agency_request_summary_private": not r.agency_request_summary_released,
+        "date_created": r.date_created.strftime(ES_DATETIME_FORMAT),
+        "date_submitted": r.date_submitted.strftime(ES_DATETIME_FORMAT),
+        "date_received": date_received,
+        "date_due": r.due_date.strftime(ES_DATETIME_FORMAT),
+        "submission": r.submission,
+        "status": r.status,
+        "agency_ein": r.agency_ein,
+        "agency_acronym": agency.acronym,
+        "agency_name": agency.name,
+        "public_title": "Private" if not r.privacy["title"] else r.title,
+        "assigned_users": [
+            "{guid}".format(guid=user.guid) for user in r.agency_users
+        ],
+        "request_type": request_type
+        # public_agency_request_summary
+    }
+
+    if r.date_closed is not None:
+        operation["date_closed"] = r.date_closed.strftime(ES_DATETIME_FORMAT)
+
+    return operation
+
+
+def enqueue_es_sync(request_ids):
+    """
+    Queue requests to have their elasticsearch docs synced by flush_es_sync_queue.
+
+    A request that is already queued keeps the time it was first queued,
+    so that the sync lag is measured from the oldest unsynced change.
 
-        if r.date_closed is not None:
-            operation["date_closed"] = r.date_closed.strftime(ES_DATETIME_FORMAT)
+    :param request_ids: list of request ids
+    """
+    if request_ids:
+        now = time()
+        es_sync_redis.zadd(
+            ES_SYNC_QUEUE_KEY, {request_id: now for request_id in request_ids}, nx=True
+        )
+
+
+def get_es_sync_lag():
+    """
+    Return the number of seconds the oldest queued request has been waiting
+    to be synced to elasticsearch (0 if nothing is queued).
+    """
+    oldest = es_sync_redis.zrange(ES_SYNC_QUEUE_KEY, 0, 0, withscores=True)
+    return time() - oldest[0][1] if oldest else 0.0
+
+
+@celery.task(bind=True, name='app.search.utils.flush_es_sync_queue',
+             autoretry_for=(OperationalError, SQLAlchemyError,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def flush_es_sync_queue(self):
+    """
+    Sync every request queued by enqueue_es_sync to elasticsearch,
+    issuing one bulk request per ELASTICSEARCH_SYNC_BATCH_SIZE requests.
+
+    Requests are popped from the queue atomically; a request changed again
+    while its batch is being flushed is re-queued and picked up by the next
+    flush. If a batch fails it is put back on the queue.
+    """
+    while True:
+        popped = es_sync_redis.zpopmin(
+            ES_SYNC_QUEUE_KEY, current_app.config["ELASTICSEARCH_SYNC_BATCH_SIZE"]
+        )
+        if not popped:
+            break
+        queued = {request_id.decode(): queued_at for request_id, queued_at in popped}
+        try:
+            num_success = _index_requests(queued.keys())
+        except Exception:
+            db.session.rollback()
+            es_sync_redis.zadd(ES_SYNC_QUEUE_KEY, queued)
+            raise
+        invalidate_search_cache()
+        current_app.logger.info(
+            "Synced {num_success} of {total_num} queued requests to elasticsearch (sync lag: {lag:.2f}s).".format(
+                num_success=num_success,
+                total_num=len(queued),
+                lag=time() - min(queued.values()),
+            )
+        )
 
-        operations.append(operation)
+
+def es_index_requests(request_ids):
+    """
+    (Re)index the docs of the given requests with a single bulk request,
+    or queue them to be synced if ELASTICSEARCH_DEFERRED_SYNC is set.
+
+    :param request_ids: list of request ids
+    """
+    if not request_ids or not current_app.config["ELASTICSEARCH_ENABLED"]:
+        return
+    if current_app.config["ELASTICSEARCH_DEFERRED_SYNC"]:
+        enqueue_es_sync(request_ids)
+        return
+    _index_requests(request_ids)
+    invalidate_search_cache()
+
+
+def _index_requests(request_ids):
+    """
+    Index the full docs of the given requests (of active agencies) in bulk.
+
+    :param request_ids: request ids
+    :return: number of docs indexed
+    """
+    requests = (
+        Requests.query.filter(Requests.id.in_(request_ids))
+        .options(joinedload(Requests.agency))
+        .options(selectinload(Requests.agency_users))
+        .options(selectinload(Requests.requester))
+        .all()
+    )
+    actions = [
+        _create_doc_action(r, r.agency, op_type="index")
+        for r in requests
+        if r.agency.is_active
+    ]
     num_success, _ = bulk(
         es,
-        operations,
+        actions,
         index=current_app.config["ELASTICSEARCH_INDEX"],
         chunk_size=current_app.config["ELASTICSEARCH_CHUNK_SIZE"],
-        raise_on_error=True,
-    )
-    current_app.logger.info(
-        "Successfully created {num_success} of {total_num} docs.".format(
-            num_success=num_success, total_num=len(requests)
-        )
     )
+    return num_success
 
 
 def search_requests(
@@ -218,6 +493,7 @@ def search_requests(
     by_phrase=False,
     highlight=False,
     for_csv=False,
+    user=None,
 ):
     """
     The arguments of this function match the request parameters
@@ -258,10 +534,15 @@ def search_requests(
         restrict highlights to public fields, iterating over elasticsearch
         query results is required)
     :param for_csv: search for a csv export
-        if True, will not check the maximum value of size against MAX_RESULT_SIZE
+        if True, returns a generator of every matching hit (see _iter_search_after)
+        instead of a single page of results
+    :param user: user to search as (the current user if None)
     :return: elasticsearch json response with result information
 
     """
+    if user is None:
+        user = current_user
+
     # clean query trailing/leading whitespace
     if query is not None:
         query = query.strip()
@@ -292,7 +573,7 @@ def search_requests(
         sort = ["date_received:desc"]
 
     # set statuses (list of request statuses)
-    if current_user.is_agency:
+    if user.is_agency:
         statuses = {
             request_status.OPEN: open_,
             request_status.CLOSED: closed,
@@ -385,14 +666,14 @@ def search_requests(
         dsl = dsl_gen.foil_id()
     else:
         if query:
-            if current_user.is_agency:
+            if user.is_agency:
                 dsl = dsl_gen.agency_user()
-            elif current_user.is_anonymous:
+            elif user.is_anonymous:
                 dsl = dsl_gen.anonymous_user()
-            elif current_user.is_public:
-                dsl = dsl_gen.public_user()
+            elif user.is_public:
+                dsl = dsl_gen.public_user(user.get_id())
             else:
-                raise InvalidUserException(current_user)
+                raise InvalidUserException(user)
         else:
             dsl = dsl_gen.queryless()
 
@@ -417,6 +698,14 @@ def search_requests(
 
     # search / run query
     if not for_csv:
+        # results of anonymous and queryless searches do not depend on the current user
+        cache_key = None
+        if current_app.config["SEARCH_CACHE_TTL"] and (user.is_anonymous or not query):
+            cache_key = _get_search_cache_key(dsl, result_set_size, start, sort)
+            cached = search_cache_redis.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+
         results = es.search(
             index=current_app.config["ELASTICSEARCH_INDEX"],
             body=dsl,
@@ -444,14 +733,14 @@ def search_requests(
             size=result_set_size,
             from_=start,
             sort=sort,
+            version=True,
         )
 
     else:
-        results = es.search(
-            index=current_app.config["ELASTICSEARCH_INDEX"],
-            scroll="1m",
-            body=dsl,
-            _source=[
+        return _iter_search_after(
+            dsl,
+            sort,
+            [
                 "requester_id",
                 "date_submitted",
                 "date_due",
@@ -472,30 +761,82 @@ def search_requests(
                 "assigned_users",
                 "request_type"
             ],
-            size=result_set_size,
-            from_=start,
-            sort=sort,
         )
-        sid = results["_scroll_id"]
-        scroll_size = results["hits"]["total"]
-
-        scroll_results = results["hits"]["hits"]
-
-        while scroll_size > 0:
-            results = es.scroll(scroll="1m", body={"scroll": "1m", "scroll_id": sid})
 
-            scroll_size = len(results["hits"]["hits"])
-
-            scroll_results += results["hits"]["hits"]
-
-        return scroll_results
     # process highlights
     if highlight and not foil_id:
         _process_highlights(results, dsl_gen.requester_id)
 
+    if cache_key is not None:
+        search_cache_redis.set(
+            cache_key, json.dumps(results), ex=current_app.config["SEARCH_CACHE_TTL"]
+        )
+
     return results
 
 
+def _get_search_cache_key(dsl, size, start, sort):
+    """
+    Return the key search results are cached under for the given query.
+
+    The key includes the current search cache generation so that cached
+    results are dropped whenever the index is written to (see invalidate_search_cache).
+    """
+    generation = search_cache_redis.get(SEARCH_CACHE_GENERATION_KEY) or b"0"
+    return SEARCH_CACHE_KEY.format(
+        generation=generation.decode(),
+        query_hash=sha1(
+            json.dumps([dsl, size, start, sort], sort_keys=True).encode()
+        ).hexdigest(),
+    )
+
+
+def invalidate_search_cache():
+    """
+    Invalidate all cached search results.
+
+    Must be called after any write to the elasticsearch index.
+    """
+    search_cache_redis.incr(SEARCH_CACHE_GENERATION_KEY)
+
+
+def _iter_search_after(dsl, sort, source):
+    """
+    Generate every hit matching the query dsl, in sort order.
+
+    Pages of ALL_RESULTS_CHUNKSIZE hits are fetched from a point in time
+    using search_after, so only a single page is held in memory at once
+    and results are consistent for the duration of the export.
+
+    :param dsl: query dsl body
+    :param sort: list of "field:direction" pairs
+    :param source: list of fields to return for each hit
+    """
+    pit_id = es.open_point_in_time(
+        index=current_app.config["ELASTICSEARCH_INDEX"], keep_alive="1m"
+    )["id"]
+    body = dict(
+        dsl,
+        size=ALL_RESULTS_CHUNKSIZE,
+        sort=[{field: direction} for field, direction in (s.split(":") for s in sort)],
+        _source=source,
+        track_total_hits=False,
+    )
+    try:
+        while True:
+            body["pit"] = {"id": pit_id, "keep_alive": "1m"}
+            results = es.search(body=body)
+            hits = results["hits"]["hits"]
+            if not hits:
+                break
+            yield from hits
+            pit_id = results.get("pit_id", pit_id)
+            # the implicit _shard_doc tiebreaker makes the last sort value unique
+            body["search_after"] = hits[-1]["sort"]
+    finally:
+        es.close_point_in_time(body={"id": pit_id})
+
+
 class RequestsDSLGenerator(object):
     """ Class for generating dicts representing query dsl bodies for searching request docs. """
 
@@ -535,9 +876,16 @@ class RequestsDSLGenerator(object):
         self.requester_id = None
 
     def foil_id(self):
-        self.__filters = [
-            {"wildcard": {"_uid": "request#FOIL-*{}*".format(self.__query)}}
-        ]
+        if FOIL_ID_MIN_GRAM <= len(self.__query) <= FOIL_ID_MAX_GRAM:
+            # ngrams are lowercased and term queries are not analyzed
+            self.__filters = [
+                {"term": {"foil_id.ngram": self.__query.lower()}}
+            ]
+        else:
+            # no ngrams of this length are indexed; FOIL IDs are uppercase
+            self.__filters = [
+                {"wildcard": {"foil_id": "*{}*".format(self.__query.upper())}}
+            ]
         return self.__must_query
 
     def agency_user(self):
@@ -562,8 +910,8 @@ class RequestsDSLGenerator(object):
             self.__conditions.append(self.__must)
         return self.__should
 
-    def public_user(self):
-        self.requester_id = current_user.get_id()
+    def public_user(self, requester_id):
+        self.requester_id = requester_id
         if self.__query_fields["title"]:
             self.__filters = [
                 {self.__match_type: {"title": self.__query}},
@@ -617,22 +965,149 @@ def convert_dates(results, dt_format=None, tz_name=None):
     datetime object or a datetime string in the specified format.
     Dates can also be offset according to the given time zone name.
 
+    Each distinct timestamp is only parsed (and offset and formatted) once,
+    since many hits share the same due and received dates.
+
     :results: elasticsearch json results
     :dt_format: datetime string format
     :tz_name: time zone name
     """
+    converted = {}
     for hit in results["hits"]["hits"]:
-        for field in ("date_submitted", "date_due", "date_received", "date_closed"):
-            dt_field = hit["_source"].get(field, None)
-            if dt_field is not None and dt_field:
-                dt = datetime.strptime(hit["_source"][field], ES_DATETIME_FORMAT)
-            else:
+        source = hit["_source"]
+        for field in ES_DATE_FIELDS:
+            value = source.get(field)
+            if not value:
                 continue
-            if tz_name:
-                dt = utc_to_local(dt, tz_name)
-            hit["_source"][field] = (
-                dt.strftime(dt_format) if dt_format is not None else dt
-            )
+            try:
+                source[field] = converted[value]
+            except KeyError:
+                # ES_DATETIME_FORMAT is ISO 8601, which fromisoformat parses far faster than strptime
+                dt = datetime.fromisoformat(value)
+                if tz_name:
+                    dt = utc_to_local(dt, tz_name)
+                source[field] = converted[value] = (
+                    dt.strftime(dt_format) if dt_format is not None else dt
+                )
+
+
+def _get_result_row_class(hit, today):
+    """
+    Return the class of the current user with respect to a search result,
+    i.e. everything (besides the doc itself) that the rendered result row depends on.
+
+    :param hit: elasticsearch search hit with converted dates (see convert_dates)
+    :param today: datetime the due date is compared against
+    """
+    source = hit["_source"]
+    guid = getattr(current_user, "guid", None)
+    is_owner = guid is not None and (
+        guid in source.get("assigned_users", []) or guid == source["requester_id"]
+    )
+    is_member = current_user.is_agency and source["agency_ein"] in current_user.get_agencies
+    is_past_due = source["date_due"] < today
+    if current_user.is_anonymous:
+        user_type = "anonymous"
+    elif current_user.is_agency:
+        user_type = "agency"
+    else:
+        user_type = "public"
+    return "{}:{:d}{:d}{:d}".format(user_type, is_owner, is_member, is_past_due)
+
+
+def render_result_rows(results, today):
+    """
+    Render the rows of the search results table ("request/result_row.html").
+
+    Rendered rows are cached by request id, doc version and the class of the
+    current user (see _get_result_row_class) so that only rows for new or
+    updated docs have to be rendered.
+
+    :param results: elasticsearch json search results (fetched with version=True)
+    :param today: datetime due dates are compared against
+    :return: rendered rows
+    """
+    hits = results["hits"]["hits"]
+    convert_dates(results)
+
+    ttl = current_app.config["SEARCH_ROW_CACHE_TTL"]
+    if not ttl:
+        return render_template("request/result_row.html", requests=hits, today=today)
+
+    keys = [
+        SEARCH_ROW_CACHE_KEY.format(
+            index=hit["_index"],
+            request_id=hit["_id"],
+            version=hit.get("_version"),
+            user_class=_get_result_row_class(hit, today),
+        )
+        for hit in hits
+    ]
+    rows = search_cache_redis.mget(keys)
+    pipe = search_cache_redis.pipeline(transaction=False)
+    for i, (hit, key, row) in enumerate(zip(hits, keys, rows)):
+        if row is None:
+            rows[i] = render_template("request/result_row.html", requests=[hit], today=today)
+            pipe.set(key, rows[i], ex=ttl)
+        else:
+            rows[i] = row.decode()
+    pipe.execute()
+    return "".join(rows)
+
+
+def format_results(results, today):
+    """
+    Return search results as structured, JSON serializable rows for rendering client-side.
+
+    Only includes what the current user would see in the rendered
+    search results table ("request/result_row.html"). Dates are ISO 8601 (UTC).
+
+    :param results: elasticsearch json search results
+    :param today: datetime due dates are compared against
+    :return: list of result rows
+    """
+    today = today.strftime(ES_DATETIME_FORMAT)  # ES_DATETIME_FORMAT strings sort chronologically
+    guid = getattr(current_user, "guid", None)
+    rows = []
+    for hit in results["hits"]["hits"]:
+        source = hit["_source"]
+        is_owner = guid is not None and (
+            guid in source.get("assigned_users", []) or guid == source["requester_id"]
+        )
+        if is_owner:
+            title = source["title"]
+        elif source["status"] in (request_status.CLOSED, request_status.IN_PROGRESS) or source["date_due"] < today:
+            title = source["public_title"] if source["title_private"] else source["title"]
+        else:
+            title = None  # under review
+        row = {
+            "id": hit["_id"],
+            "url": url_for("request.view", request_id=hit["_id"]),
+            "title": title,
+            "date_received": _to_iso_utc(source.get("date_received")),
+            "date_due": _to_iso_utc(source.get("date_due")),
+        }
+        if current_user.is_agency:
+            row["status"] = source["status"]
+            row["agency"] = source["agency_acronym"]
+            row["redacted"] = source["agency_ein"] not in current_user.get_agencies
+            if not row["redacted"]:
+                row["date_closed"] = _to_iso_utc(source.get("date_closed"))
+                row["requester_name"] = source["requester_name"]
+        else:
+            row["status"] = request_status.CLOSED if source["status"] == request_status.CLOSED else request_status.OPEN
+            row["agency"] = source["agency_name"]
+        rows.append(row)
+    return rows
+
+
+def _to_iso_utc(value):
+    """
+    Return an elasticsearch datetime string as an ISO 8601 UTC datetime string.
+
+    :param value: ES_DATETIME_FORMAT datetime string or None
+    """
+    return value + "Z" if value else None
 
 
 def _process_highlights(results, requester_id=None):
@@ -666,3 +1141,291 @@ def _process_highlights(results, requester_id=None):
                 hit["highlight"].pop("agency_request_summary")
             if "description" in hit["highlight"] and not is_requester:
                 hit["highlight"].pop("description")
+
+
+def get_csv_search_kwargs(args, user=None):
+    """
+    Return the search_requests keyword arguments for a CSV export of
+    the search described by the request parameters (see /search/requests/<doc_type>).
+
+    :param args: request parameters
+    :param user: user to search as (the current user if None)
+    """
+    if user is None:
+        user = current_user
+    return dict(
+        query=args.get("query"),
+        foil_id=eval_request_bool(args.get("foil_id")),
+        title=eval_request_bool(args.get("title")),
+        agency_request_summary=eval_request_bool(args.get("agency_request_summary")),
+        description=eval_request_bool(args.get("description"))
+        if not user.is_anonymous
+        else False,
+        requester_name=eval_request_bool(args.get("requester_name"))
+        if user.is_agency
+        else False,
+        date_rec_from=args.get("date_rec_from"),
+        date_rec_to=args.get("date_rec_to"),
+        date_due_from=args.get("date_due_from"),
+        date_due_to=args.get("date_due_to"),
+        date_closed_from=args.get("date_closed_from"),
+        date_closed_to=args.get("date_closed_to"),
+        agency_ein=args.get("agency_ein", ""),
+        agency_user_guid=args.get("agency_user"),
+        request_type=args.get("request_type"),
+        open_=eval_request_bool(args.get("open")),
+        closed=eval_request_bool(args.get("closed")),
+        in_progress=eval_request_bool(args.get("in_progress"))
+        if user.is_agency
+        else False,
+        due_soon=eval_request_bool(args.get("due_soon"))
+        if user.is_agency
+        else False,
+        overdue=eval_request_bool(args.get("overdue"))
+        if user.is_agency
+        else False,
+        start=0,
+        sort_date_received=args.get("sort_date_submitted"),
+        sort_date_due=args.get("sort_date_due"),
+        sort_title=args.get("sort_title"),
+        tz_name=args.get("tz_name", current_app.config["APP_TIMEZONE"]),
+        for_csv=True,
+        user=user,
+    )
+
+
+def generate_requests_csv(results, user_agencies):
+    """
+    Generate the rows of a search result-set CSV as they are written.
+
+    Requests are loaded from the database ALL_RESULTS_CHUNKSIZE at a time,
+    in the order they were returned by elasticsearch.
+
+    :param results: iterable of elasticsearch hits
+    :param user_agencies: agency eins whose requests may be included
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        [
+            "FOIL ID",
+            "Agency",
+            "Title",
+            "Description",
+            "Agency Request Summary",
+            "Current Status",
+            "Date Created",
+            "Date Received",
+            "Date Due",
+            "Date Closed",
+            "Requester Name",
+            "Requester Email",
+            "Requester Title",
+            "Requester Organization",
+            "Requester Phone Number",
+            "Requester Fax Number",
+            "Requester Address 1",
+            "Requester Address 2",
+            "Requester City",
+            "Requester State",
+            "Requester Zipcode",
+            "Assigned User Emails",
+        ]
+    )
+    yield _pop_buffer(buffer)
+
+    for ids in _chunk((result["_id"] for result in results), ALL_RESULTS_CHUNKSIZE):
+        requests_by_id = {
+            req.id: req
+            for req in Requests.query.filter(
+                Requests.id.in_(ids), Requests.agency_ein.in_(user_agencies)
+            )
+            .options(selectinload(Requests.agency_users))
+            .options(selectinload(Requests.requester))
+            .options(joinedload(Requests.agency))
+            .all()
+        }
+        for req in (requests_by_id[id_] for id_ in ids if id_ in requests_by_id):
+            writer.writerow(
+                [
+                    req.id,
+                    req.agency.name,
+                    Markup(req.title).unescape(),
+                    Markup(req.description).unescape(),
+                    req.agency_request_summary,
+                    req.status,
+                    req.date_created,
+                    req.date_submitted,
+                    req.due_date,
+                    req.date_closed,
+                    Markup(req.requester.fullname).unescape(),
+                    req.requester.email,
+                    Markup(req.requester.title).unescape(),
+                    Markup(req.requester.organization).unescape(),
+                    req.requester.phone_number,
+                    req.requester.fax_number,
+                    Markup(req.requester.mailing_address.get("address_one")).unescape(),
+                    Markup(req.requester.mailing_address.get("address_two")).unescape(),
+                    Markup(req.requester.mailing_address.get("city")).unescape(),
+                    req.requester.mailing_address.get("state"),
+                    req.requester.mailing_address.get("zip"),
+                    ", ".join(u.email for u in req.agency_users),
+                ]
+            )
+        yield _pop_buffer(buffer)
+
+
+def _chunk(iterable, size):
+    """
+    Generate lists of (at most) size items from iterable.
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _pop_buffer(buffer):
+    """
+    Return the contents of a StringIO buffer and empty it.
+    """
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return value
+
+
+def enqueue_requests_export(user_guid, args, use_gzip=False):
+    """
+    Start generating a search result-set CSV in the background (see generate_requests_export).
+
+    If the user already has an identical export in progress, that export is returned instead.
+
+    :param user_guid: guid of the user requesting the export
+    :param args: request parameters describing the search
+    :param use_gzip: gzip the CSV?
+    :return: tuple of (export id, export status)
+    """
+    args = {key: value for key, value in args.items() if key not in EXPORT_IGNORED_ARGS}
+    dedup_key = EXPORT_DEDUP_KEY.format(
+        user_guid=user_guid,
+        query_hash=sha1(json.dumps([sorted(args.items()), use_gzip]).encode()).hexdigest(),
+    )
+    export_id = uuid4().hex
+    if not upload_redis.set(dedup_key, export_id, nx=True, ex=EXPORT_TTL):
+        existing_id = upload_redis.get(dedup_key)
+        if existing_id is not None:
+            existing_id = existing_id.decode()
+            existing = get_requests_export(existing_id)
+            if existing is not None and existing["status"] == export_status.PENDING:
+                return existing_id, existing["status"]
+        upload_redis.set(dedup_key, export_id, ex=EXPORT_TTL)
+
+    _set_requests_export(export_id, user_guid=user_guid, status=export_status.PENDING)
+    download_url = url_for("search.requests_export_download", export_id=export_id, _external=True)
+    generate_requests_export.apply_async(
+        args=[export_id, user_guid, args, use_gzip, dedup_key, download_url], task_id=export_id
+    )
+    return export_id, export_status.PENDING
+
+
+def get_requests_export(export_id):
+    """
+    Return the stored information (user_guid, status, path, filename) of
+    a background export or None if it does not exist or has expired.
+
+    :param export_id: id of the export
+    """
+    export = upload_redis.get(EXPORT_KEY.format(export_id=export_id))
+    return json.loads(export) if export is not None else None
+
+
+def _set_requests_export(export_id, **kwargs):
+    upload_redis.set(EXPORT_KEY.format(export_id=export_id), json.dumps(kwargs), ex=EXPORT_TTL)
+
+
+@celery.task(bind=True, name='app.search.utils.generate_requests_export',
+             autoretry_for=(OperationalError, SQLAlchemyError,), retry_kwargs={'max_retries': 5}, retry_backoff=True)
+def generate_requests_export(self, export_id, user_guid, args, use_gzip, dedup_key, download_url):
+    """
+    Celery task that writes the CSV of a search result-set to upload storage
+    and emails the user a link to download it.
+
+    The search is run as the requesting user (see search_requests).
+
+    :param export_id: id of the export
+    :param user_guid: guid of the user requesting the export
+    :param args: request parameters describing the search
+    :param use_gzip: gzip the CSV?
+    :param dedup_key: redis key used to prevent identical in-flight exports
+    :param download_url: url of the export's download page, emailed to the user
+    """
+    user = Users.query.filter_by(guid=user_guid).one()
+    tz_name = args.get("tz_name", current_app.config["APP_TIMEZONE"])
+    filename = "FOIL_requests_results_{timestamp}.csv{ext}".format(
+        timestamp=utc_to_local(datetime.utcnow(), tz_name).strftime("%m_%d_%Y_at_%I_%M_%p"),
+        ext=".gz" if use_gzip else "",
+    )
+    stored_name = "{export_id}.csv{ext}".format(export_id=export_id, ext=".gz" if use_gzip else "")
+    tmp_path = os.path.join(current_app.config["UPLOAD_QUARANTINE_DIRECTORY"], stored_name)
+    path = os.path.join(current_app.config["UPLOAD_DIRECTORY"], EXPORT_DIRNAME, stored_name)
+    try:
+        results = search_requests(**get_csv_search_kwargs(args, user))
+        with (gzip.open if use_gzip else open)(tmp_path, "wt", newline="", encoding="UTF-8") as fp:
+            for chunk in generate_requests_csv(results, user.get_agencies):
+                fp.write(chunk)
+
+        if current_app.config["USE_VOLUME_STORAGE"]:
+            dst_dir = os.path.dirname(path)
+            if not fu.exists(dst_dir):
+                fu.makedirs(dst_dir)
+            fu.move(tmp_path, path)
+        elif current_app.config["USE_AZURE_STORAGE"]:
+            fu.azure_upload(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # keep the export pending (and deduplicated) while autoretry_for will retry it
+        if not (isinstance(e, self.autoretry_for)
+                and self.request.retries < self.retry_kwargs.get("max_retries", self.max_retries)):
+            _set_requests_export(export_id, user_guid=user_guid, status=export_status.FAILED)
+            upload_redis.delete(dedup_key)
+        raise
+
+    upload_redis.delete(dedup_key)
+    upload_redis.zadd(EXPORT_FILES_KEY, {path: time()})
+    _set_requests_export(
+        export_id,
+        user_guid=user_guid,
+        status=export_status.READY,
+        path=path,
+        filename=filename,
+    )
+    send_email(
+        subject="OpenRecords Search Results Export",
+        to=[user.notification_email or user.email],
+        template="email_templates/email_search_export_generated",
+        agency_user=user.name,
+        download_url=download_url,
+    )
+
+
+@celery.task(name='app.search.utils.delete_expired_exports')
+def delete_expired_exports():
+    """
+    Celery task that deletes the stored files of background exports
+    older than EXPORT_TTL, whose download links have expired.
+    """
+    expired = upload_redis.zrangebyscore(EXPORT_FILES_KEY, 0, time() - EXPORT_TTL)
+    for path in (path.decode() for path in expired):
+        if current_app.config["USE_VOLUME_STORAGE"]:
+            if fu.exists(path):
+                fu.remove(path)
+        elif current_app.config["USE_AZURE_STORAGE"]:
+            if fu.azure_exists(path):
+                fu.azure_delete(path)
+        upload_redis.zrem(EXPORT_FILES_KEY, path)
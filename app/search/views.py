@@ -1,19 +1,32 @@
-import csv
+import os
 from datetime import datetime
-from io import StringIO, BytesIO
 import re
 
-from flask import current_app, request, render_template, jsonify, Markup
-from flask.helpers import send_file
-from flask_login import current_user
-from sqlalchemy.orm import joinedload
+from flask import (
+    current_app,
+    request,
+    jsonify,
+    Response,
+    abort,
+    stream_with_context,
+    url_for,
+)
+from flask_login import current_user, login_required
 
+import app.lib.file_utils as fu
 from app.lib.date_utils import utc_to_local
 from app.lib.utils import eval_request_bool
-from app.models import Requests
 from app.search import search
-from app.search.constants import DEFAULT_HITS_SIZE, ALL_RESULTS_CHUNKSIZE
-from app.search.utils import search_requests, convert_dates
+from app.search.constants import DEFAULT_HITS_SIZE, export_status
+from app.search.utils import (
+    search_requests,
+    format_results,
+    render_result_rows,
+    enqueue_requests_export,
+    generate_requests_csv,
+    get_csv_search_kwargs,
+    get_requests_export,
+)
 from app import sentry
 
 
@@ -52,6 +65,9 @@ def requests():
     - Status, Overdue
     - Date Due
 
+    Results are returned as rendered table rows unless "format" is "json",
+    in which case they are returned as structured rows (see app.search.utils.format_results).
+
     """
     try:
         agency_ein = request.args.get("agency_ein", "")
@@ -123,13 +139,10 @@ def requests():
     total = results["hits"]["total"]
     formatted_results = None
     if total != 0:
-        convert_dates(results)
-        formatted_results = render_template(
-            "request/result_row.html",
-            requests=results["hits"]["hits"],
-            today=datetime.utcnow(),
-        )
-        # query=query)  # only for testing
+        if request.args.get("format") == "json":
+            formatted_results = format_results(results, datetime.utcnow())
+        else:
+            formatted_results = render_result_rows(results, datetime.utcnow())
     return (
         jsonify(
             {
@@ -150,6 +163,9 @@ def requests_doc(doc_type):
     - Filtering on set size is ignored; all results are returned.
     - Currently only supports CSVs.
     - CSV only includes requests belonging to that user's agency
+    - If "async_export" is true, the CSV is generated in the background
+      (gzipped if "gzip" is true) and the user is emailed a download link;
+      the export id and status url are returned instead.
 
     Document name format: "FOIL_requests_results_<timestamp:MM_DD_YYYY_at_HH_mm_pp>"
 
@@ -158,127 +174,89 @@ def requests_doc(doc_type):
     :param doc_type: document type ('csv' only)
     """
     if current_user.is_agency and doc_type.lower() == "csv":
-        try:
-            agency_ein = request.args.get("agency_ein", "")
-        except ValueError:
-            sentry.captureException()
-            agency_ein = None
+        if eval_request_bool(request.args.get("async_export")):
+            export_id, status = enqueue_requests_export(
+                current_user.guid,
+                request.args.to_dict(),
+                use_gzip=eval_request_bool(request.args.get("gzip")),
+            )
+            return (
+                jsonify(
+                    {
+                        "export_id": export_id,
+                        "status": status,
+                        "status_url": url_for(
+                            "search.requests_export_status", export_id=export_id
+                        ),
+                    }
+                ),
+                202,
+            )
 
         tz_name = request.args.get("tz_name", current_app.config["APP_TIMEZONE"])
-
-        start = 0
-        buffer = StringIO()  # csvwriter cannot accept BytesIO
-        writer = csv.writer(buffer)
-        writer.writerow(
-            [
-                "FOIL ID",
-                "Agency",
-                "Title",
-                "Description",
-                "Agency Request Summary",
-                "Current Status",
-                "Date Created",
-                "Date Received",
-                "Date Due",
-                "Date Closed",
-                "Requester Name",
-                "Requester Email",
-                "Requester Title",
-                "Requester Organization",
-                "Requester Phone Number",
-                "Requester Fax Number",
-                "Requester Address 1",
-                "Requester Address 2",
-                "Requester City",
-                "Requester State",
-                "Requester Zipcode",
-                "Assigned User Emails",
-            ]
-        )
-        results = search_requests(
-            query=request.args.get("query"),
-            foil_id=eval_request_bool(request.args.get("foil_id")),
-            title=eval_request_bool(request.args.get("title")),
-            agency_request_summary=eval_request_bool(
-                request.args.get("agency_request_summary")
-            ),
-            description=eval_request_bool(request.args.get("description"))
-            if not current_user.is_anonymous
-            else False,
-            requester_name=eval_request_bool(request.args.get("requester_name"))
-            if current_user.is_agency
-            else False,
-            date_rec_from=request.args.get("date_rec_from"),
-            date_rec_to=request.args.get("date_rec_to"),
-            date_due_from=request.args.get("date_due_from"),
-            date_due_to=request.args.get("date_due_to"),
-            date_closed_from=request.args.get("date_closed_from"),
-            date_closed_to=request.args.get("date_closed_to"),
-            agency_ein=agency_ein,
-            agency_user_guid=request.args.get("agency_user"),
-            request_type=request.args.get("request_type"),
-            open_=eval_request_bool(request.args.get("open")),
-            closed=eval_request_bool(request.args.get("closed")),
-            in_progress=eval_request_bool(request.args.get("in_progress"))
-            if current_user.is_agency
-            else False,
-            due_soon=eval_request_bool(request.args.get("due_soon"))
-            if current_user.is_agency
-            else False,
-            overdue=eval_request_bool(request.args.get("overdue"))
-            if current_user.is_agency
-            else False,
-            start=start,
-            sort_date_received=request.args.get("sort_date_submitted"),
-            sort_date_due=request.args.get("sort_date_due"),
-            sort_title=request.args.get("sort_title"),
-            tz_name=request.args.get("tz_name", current_app.config["APP_TIMEZONE"]),
-            for_csv=True,
-        )
-        ids = [result["_id"] for result in results]
-        all_requests = (
-            Requests.query.filter(Requests.id.in_(ids))
-            .options(joinedload(Requests.agency_users))
-            .options(joinedload(Requests.requester))
-            .options(joinedload(Requests.agency))
-            .all()
-        )
+        results = search_requests(**get_csv_search_kwargs(request.args))
         user_agencies = current_user.get_agencies
-        for req in all_requests:
-            if req.agency_ein in user_agencies:
-                writer.writerow(
-                    [
-                        req.id,
-                        req.agency.name,
-                        Markup(req.title).unescape(),
-                        Markup(req.description).unescape(),
-                        req.agency_request_summary,
-                        req.status,
-                        req.date_created,
-                        req.date_submitted,
-                        req.due_date,
-                        req.date_closed,
-                        Markup(req.requester.fullname).unescape(),
-                        req.requester.email,
-                        Markup(req.requester.title).unescape(),
-                        Markup(req.requester.organization).unescape(),
-                        req.requester.phone_number,
-                        req.requester.fax_number,
-                        Markup(req.requester.mailing_address.get("address_one")).unescape(),
-                        Markup(req.requester.mailing_address.get("address_two")).unescape(),
-                        Markup(req.requester.mailing_address.get("city")).unescape(),
-                        req.requester.mailing_address.get("state"),
-                        req.requester.mailing_address.get("zip"),
-                        ", ".join(u.email for u in req.agency_users),
-                    ]
-                )
+
         dt = datetime.utcnow()
         timestamp = utc_to_local(dt, tz_name) if tz_name is not None else dt
-        return send_file(
-            BytesIO(buffer.getvalue().encode("UTF-8")),  # convert to bytes
-            download_name="FOIL_requests_results_{}.csv".format(
-                timestamp.strftime("%m_%d_%Y_at_%I_%M_%p")
-            ),
-            as_attachment=True,
+        return Response(
+            stream_with_context(generate_requests_csv(results, user_agencies)),
+            mimetype="text/csv",
+            headers={
+                "Content-Disposition": "attachment; filename=FOIL_requests_results_{}.csv".format(
+                    timestamp.strftime("%m_%d_%Y_at_%I_%M_%p")
+                )
+            },
         )
     return "", 400
+
+
+@search.route("/requests/exports/<export_id>", methods=["GET"])
+@login_required
+def requests_export_status(export_id):
+    """
+    Return the status of a background search result-set export
+    (see /search/requests/<doc_type>).
+
+    :param export_id: id of the export
+    """
+    export = get_requests_export(export_id)
+    if export is None or export["user_guid"] != current_user.guid:
+        return abort(404)
+    return (
+        jsonify(
+            {
+                "status": export["status"],
+                "download_url": url_for(
+                    "search.requests_export_download", export_id=export_id
+                )
+                if export["status"] == export_status.READY
+                else None,
+            }
+        ),
+        200,
+    )
+
+
+@search.route("/requests/exports/<export_id>/download", methods=["GET"])
+@login_required
+def requests_export_download(export_id):
+    """
+    Send the file generated by a background search result-set export.
+
+    :param export_id: id of the export
+    """
+    export = get_requests_export(export_id)
+    if (
+        export is None
+        or export["user_guid"] != current_user.guid
+        or export["status"] != export_status.READY
+    ):
+        return abort(404)
+    directory, filename = os.path.split(export["path"])
+    return fu.send_file(
+        directory,
+        filename,
+        as_attachment=True,
+        download_name=export["filename"],
+    )
@@ -18,6 +18,7 @@ $(function () {
         dateClosedReq = $("#date-closed-req"),
         noResultsFound = true,
         generateDocBtn = $("#generate-document"),
+        emailDocBtn = $("#email-document"),
         agencySelect = $("#agency_ein"),
         agencyUserDiv = $("#agency-user-div"),
         agencyUserSelect = $("#agency_user"),
@@ -129,6 +130,7 @@ $(function () {
             searchBtn.attr("disabled", true);
             searchBtnAdv.attr("disabled", true);
             generateDocBtn.attr("disabled", true);
+            emailDocBtn.attr("disabled", true);
         } else {
             canSearch = true;
             searchBtn.attr("disabled", false);
@@ -136,6 +138,7 @@ $(function () {
             dateError.css("display", "none");
             if (!noResultsFound) {
                 generateDocBtn.attr("disabled", false);
+                emailDocBtn.attr("disabled", false);
             }
         }
     }
@@ -316,6 +319,7 @@ $(function () {
                         prev.removeClass("disabled")
                     }
                     generateDocBtn.attr("disabled", false);
+                    emailDocBtn.attr("disabled", false);
 
                     if (toFocus) {
                         scrollToElement(resultsHeader);
@@ -326,12 +330,14 @@ $(function () {
                     results.html("<div class='row'><div class='col-sm-12 errorResults'>" +
                         "<p class='text-center' aria-live='polite'>No results found.</p></div></div>");
                     generateDocBtn.attr("disabled", true);
+                    emailDocBtn.attr("disabled", true);
                 }
             },
             error: function (e) {
                 results.html("<div class='row'><div class='col-sm-12 errorResults'>" +
                     "<p class='text-center' aria-live='assertive'>Hmmmm.... Looks like something's gone wrong.</p></div></div>");
                 generateDocBtn.attr("disabled", true);
+                emailDocBtn.attr("disabled", true);
             }
         });
     }
@@ -403,6 +409,21 @@ $(function () {
             search();
         }
     });
+    emailDocBtn.click(function () {
+        var data = $("#search-form").serializeArray();
+        data.push({name: "async_export", value: "true"});
+        $.ajax({
+            url: $("#search-form").attr("action"),
+            data: data,
+            success: function () {
+                $("#generate-document-error").text("Your CSV is being generated. " +
+                    "You will receive an email with a link to download it once it is complete.");
+            },
+            error: function () {
+                $("#generate-document-error").text("Hmmmm.... Looks like something's gone wrong.");
+            }
+        });
+    });
     $(".status").click(function () {
         resetAndSearch();
     });
@@ -5,7 +5,6 @@
 """
 
 import os
-import magic
 import subprocess
 
 import app.lib.file_utils as fu
@@ -84,14 +83,11 @@ def is_valid_file_type(obj):
     """
     buffer = obj.stream.read(MAX_CHUNKSIZE)
     # 1. Check using default
-    mime_type = magic.from_buffer(buffer, mime=True)
+    mime_type = fu.get_magic().from_buffer(buffer)
     is_valid = mime_type in ALLOWED_MIMETYPES
     if is_valid and current_app.config['MAGIC_FILE']:
         # 3. Check using custom
-        m = magic.Magic(
-            magic_file=current_app.config['MAGIC_FILE'],
-            mime=True)
-        m.from_buffer(buffer)
+        fu.get_magic(current_app.config['MAGIC_FILE']).from_buffer(buffer)
         is_valid = mime_type in ALLOWED_MIMETYPES
     obj.stream.seek(0)
     return is_valid, mime_type
@@ -173,18 +169,19 @@ def complete_upload(request_id, quarantine_path, filename):
         request_id
     )
     if current_app.config['USE_VOLUME_STORAGE']:
-        if not fu.exists(dst_dir):
-            try:
-                fu.makedirs(dst_dir)
-            except OSError as e:
-                sentry.captureException()
-                # in the time between the call to fu.exists
-                # and fu.makedirs, the directory was created
-                current_app.logger.error("OS Error: {}".format(e.args))
-        fu.move(
-            quarantine_path,
-            os.path.join(dst_dir, filename)
-        )
+        with fu.sftp_batch():
+            if not fu.exists(dst_dir):
+                try:
+                    fu.makedirs(dst_dir)
+                except OSError as e:
+                    sentry.captureException()
+                    # in the time between the call to fu.exists
+                    # and fu.makedirs, the directory was created
+                    current_app.logger.error("OS Error: {}".format(e.args))
+            fu.move(
+                quarantine_path,
+                os.path.join(dst_dir, filename)
+            )
     elif current_app.config['USE_AZURE_STORAGE']:
         fu.azure_upload(quarantine_path, os.path.join(dst_dir, filename))
 
@@ -75,8 +75,7 @@ def post(request_id):
         filename = secure_filename(file_.filename)
         is_update = eval_request_bool(request.form.get('update'))
         agency_ein = Requests.query.filter_by(id=request_id).one().agency.ein
-        if is_allowed(user=current_user, request_id=request_id, permission=permission.ADD_FILE) or \
-                is_allowed(user=current_user, request_id=request_id, permission=permission.EDIT_FILE):
+        if is_allowed(user=current_user, request_id=request_id, permission=permission.ADD_FILE | permission.EDIT_FILE):
             response_id = request.form.get('response_id') if is_update else None
             if upload_exists(request_id, filename, response_id):
                 response = {
@@ -193,8 +192,8 @@ def delete(r_id_type, r_id, filecode):
 
             path = ''
             quarantined_only = eval_request_bool(request.form.get('quarantined_only'))
-            has_add_edit = (is_allowed(user=current_user, request_id=r_id, permission=permission.ADD_FILE) or
-                            is_allowed(user=current_user, request_id=r_id, permission=permission.EDIT_FILE))
+            has_add_edit = is_allowed(user=current_user, request_id=r_id,
+                                      permission=permission.ADD_FILE | permission.EDIT_FILE)
             if quarantined_only and has_add_edit:
                 path = os.path.join(
                     current_app.config['UPLOAD_QUARANTINE_DIRECTORY'],
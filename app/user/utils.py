@@ -12,11 +12,13 @@ from app import (
     es
 )
 from app.constants import (bulk_updates, event_type, role_name, user_type_request)
+from app.lib.permission_utils import clear_permissions_masks
 from app.lib.email_utils import (
     get_agency_admin_emails,
     send_email,
 )
 from app.models import (Agencies, Events, Requests, Roles, UserRequests, Users)
+from app.search.utils import invalidate_search_cache
 
 
 @celery.task(bind=True, name='app.user.utils.make_user_admin', autoretry_for=(OperationalError, SQLAlchemyError,),
@@ -43,8 +45,15 @@ def make_user_admin(self, modified_user_guid: str, current_user_guid: str, agenc
     update_user_requests = []
     update_user_requests_events = []
 
+    existing_values = {
+        user_request.request_id: user_request for user_request in UserRequests.query.filter(
+            UserRequests.user_guid == user.guid,
+            UserRequests.request_id.in_(requests)
+        )
+    }
+
     for request in requests:
-        existing_value = UserRequests.query.filter_by(request_id=request, user_guid=user.guid).one_or_none()
+        existing_value = existing_values.get(request)
 
         if existing_value and existing_value.permissions != permissions:
             user_request = bulk_updates.UserRequestsDict(
@@ -104,10 +113,11 @@ def make_user_admin(self, modified_user_guid: str, current_user_guid: str, agenc
     try:
         UserRequests.query.filter(UserRequests.user_guid == user.guid).update([('permissions', permissions)])
 
-        db.session.bulk_insert_mappings(Events, update_user_requests_events)
         db.session.bulk_insert_mappings(UserRequests, new_user_requests)
-        db.session.bulk_insert_mappings(Events, new_user_requests_events)
+        db.session.bulk_insert_mappings(Events, update_user_requests_events + new_user_requests_events)
         db.session.commit()
+        # bulk operations do not emit the mapper events that clear cached permissions
+        clear_permissions_masks()
 
         agency = Agencies.query.filter_by(ein=agency_ein).one()
 
@@ -125,6 +135,7 @@ def make_user_admin(self, modified_user_guid: str, current_user_guid: str, agenc
 
     except SQLAlchemyError:
         db.session.rollback()
+        raise
 
 
 @celery.task(bind=True, name='app.user.utils.remove_user_permissions',
@@ -170,6 +181,7 @@ def remove_user_permissions(self, modified_user_guid: str, current_user_guid: st
             synchronize_session=False)
         db.session.bulk_insert_mappings(Events, remove_user_request_events)
         db.session.commit()
+        clear_permissions_masks()
 
         es_update_assigned_users.apply_async(args=[request_ids])
 
@@ -195,6 +207,7 @@ def remove_user_permissions(self, modified_user_guid: str, current_user_guid: st
 
     except SQLAlchemyError:
         db.session.rollback()
+        raise
 
 
 @celery.task(bind=True, name='app.user.utils.es_update_assigned_users',
@@ -224,3 +237,4 @@ def es_update_assigned_users(self, request_ids: list):
         index=current_app.config['ELASTICSEARCH_INDEX'],
         chunk_size=current_app.config['ELASTICSEARCH_CHUNK_SIZE']
     )
+    invalidate_search_cache()
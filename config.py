@@ -57,6 +57,10 @@ class Config:
     SFTP_PASSWORD = os.environ.get('SFTP_PASSWORD', '').replace("'", "")
     SFTP_RSA_KEY_FILE = os.environ.get('SFTP_RSA_KEY_FILE')
     SFTP_UPLOAD_DIRECTORY = os.environ.get('SFTP_UPLOAD_DIRECTORY')
+    # SFTP sessions are pooled per process (app.lib.file_utils.SFTPConnectionPool)
+    SFTP_POOL_SIZE = int(os.environ.get('SFTP_POOL_SIZE', 4))  # idle sessions kept open
+    SFTP_POOL_MAX_IDLE = int(os.environ.get('SFTP_POOL_MAX_IDLE', 300))  # seconds before an idle session is closed
+    SFTP_KEEPALIVE = int(os.environ.get('SFTP_KEEPALIVE', 30))  # seconds between SSH keepalive packets
 
     # Authentication Settings
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=int(os.environ.get('PERMANENT_SESSION_LIFETIME', 20)))
@@ -98,6 +102,8 @@ class Config:
     SESSION_REDIS_DB = 1
     UPLOAD_REDIS_DB = 2
     EMAIL_REDIS_DB = 3
+    ES_SYNC_REDIS_DB = 4
+    SEARCH_CACHE_REDIS_DB = 5
 
     SESSION_REDIS = redis.StrictRedis(db=SESSION_REDIS_DB,
                                       host=REDIS_HOST,
@@ -138,11 +144,13 @@ class Config:
     # TODO: change naming since quarantine is used as a serving directory as well
     UPLOAD_QUARANTINE_DIRECTORY = (os.environ.get('UPLOAD_QUARANTINE_DIRECTORY') or
                                    os.path.join(os.path.abspath(os.path.dirname(__file__)), 'quarantine/incoming/'))
-    UPLOAD_SERVING_DIRECTORY = (os.environ.get('UPLOAD_SERVING_DIRECTORY') or
-                                os.path.join(os.path.abspath(os.path.dirname(__file__)), 'quarantine/outgoing/'))
     UPLOAD_DIRECTORY = (os.environ.get('UPLOAD_DIRECTORY') or
                         os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data/')
                         if not USE_SFTP else SFTP_UPLOAD_DIRECTORY)
+    # Files are served directly from UPLOAD_DIRECTORY; set USE_X_SENDFILE to hand them off to the web server
+    # with X-Sendfile, or X_ACCEL_REDIRECT_LOCATION to the nginx internal location aliased to UPLOAD_DIRECTORY
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == "True"
+    X_ACCEL_REDIRECT_LOCATION = os.environ.get('X_ACCEL_REDIRECT_LOCATION')
     VIRUS_SCAN_ENABLED = os.environ.get('VIRUS_SCAN_ENABLED') == "True"
     MAGIC_FILE = (os.environ.get('MAGIC_FILE') or
                   os.path.join(os.path.abspath(os.path.dirname(__file__)), 'magic'))
@@ -164,6 +172,16 @@ class Config:
                                if ELASTICSEARCH_USERNAME and ELASTICSEARCH_PASSWORD
                                else None)
     ELASTICSEARCH_CHUNK_SIZE = int(os.environ.get('ELASTICSEARCH_CHUNK_SIZE', 100))
+    # Queue request doc updates and flush them in bulk (app.search.utils.flush_es_sync_queue)
+    # instead of updating elasticsearch synchronously on every write
+    ELASTICSEARCH_DEFERRED_SYNC = os.environ.get('ELASTICSEARCH_DEFERRED_SYNC') == "True"
+    ELASTICSEARCH_SYNC_BATCH_SIZE = int(os.environ.get('ELASTICSEARCH_SYNC_BATCH_SIZE', 500))
+    # Seconds to cache anonymous and queryless search results for (0 disables caching)
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 30))
+    # Seconds to cache rendered search result rows for (0 disables caching)
+    SEARCH_ROW_CACHE_TTL = int(os.environ.get('SEARCH_ROW_CACHE_TTL', 60 * 60))
+    # Seconds to cache the logged in user's snapshot for (0 disables caching)
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 20 * 60))
 
     # https://www.elastic.co/blog/index-vs-type
 
@@ -177,6 +195,11 @@ class Config:
     AZURE_STORAGE_CONTAINER = os.environ.get('AZURE_STORAGE_CONTAINER')
     AZURE_STORAGE_ACCOUNT_NAME = os.environ.get('AZURE_STORAGE_ACCOUNT_NAME')
     AZURE_STORAGE_ACCOUNT_KEY = os.environ.get('AZURE_STORAGE_ACCOUNT_KEY')
+    # Blobs larger than AZURE_STORAGE_MAX_SINGLE_PUT_SIZE bytes are uploaded in blocks of AZURE_STORAGE_MAX_BLOCK_SIZE
+    # bytes; blocks (and download chunks) are transferred AZURE_STORAGE_MAX_CONCURRENCY at a time
+    AZURE_STORAGE_MAX_BLOCK_SIZE = int(os.environ.get('AZURE_STORAGE_MAX_BLOCK_SIZE', 4 * 1024 * 1024))
+    AZURE_STORAGE_MAX_SINGLE_PUT_SIZE = int(os.environ.get('AZURE_STORAGE_MAX_SINGLE_PUT_SIZE', 8 * 1024 * 1024))
+    AZURE_STORAGE_MAX_CONCURRENCY = int(os.environ.get('AZURE_STORAGE_MAX_CONCURRENCY', 4))
 
     @staticmethod
     def init_app(app):
@@ -45,6 +45,7 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 dotenv_path = os.path.join(basedir, '.env')
 load_dotenv(dotenv_path)
 
+import json
 from datetime import datetime
 from urllib.parse import unquote, urljoin
 import sys
@@ -55,12 +56,14 @@ from flask import url_for, render_template, request as flask_request
 from flask.cli import main
 from flask_login import login_user
 from flask_migrate import Migrate, upgrade
+from sqlalchemy import desc
 from werkzeug.middleware.profiler import ProfilerMiddleware
 
-from app import create_app, db
-from app.constants import OPENRECORDS_DL_EMAIL
+from app import create_app, db, es_sync_redis
+from app.constants import OPENRECORDS_DL_EMAIL, event_type, request_status, response_type
 from app.jobs import _update_request_statuses
 from app.lib.date_utils import process_due_date, local_to_utc
+from app.lib.db_utils import explain_analyze
 from app.lib.email_utils import send_email
 from app.models import (
     Agencies,
@@ -75,6 +78,7 @@ from app.models import (
     Letters,
     Reasons,
     Requests,
+    ResponseTokens,
     Responses,
     Roles,
     UserRequests,
@@ -83,7 +87,8 @@ from app.models import (
 from app.report.utils import generate_request_closing_user_report, generate_monthly_metrics_report
 from app.request.utils import generate_guid
 from app.response.utils import add_extension
-from app.search.utils import recreate
+from app.search.constants import ES_SYNC_QUEUE_KEY
+from app.search.utils import recreate, get_es_sync_lag
 from app.user.utils import make_user_admin
 
 if os.getenv('FLASK_ENV') != 'production':
@@ -224,11 +229,84 @@ def generate_monthly_report(agency_ein: str, date_from: str, date_to: str, email
 
 
 @app.cli.command()
-def es_recreate():
+@click.option(
+    "--zero-downtime",
+    is_flag=True,
+    default=False,
+    help="Build a new index in the background and swap the alias to it when done.",
+)
+def es_recreate(zero_downtime: bool = False):
     """
     Recreate elasticsearch index and request docs.
     """
-    recreate()
+    recreate(zero_downtime=zero_downtime)
+
+
+@app.cli.command()
+def es_sync_status():
+    """
+    Show the number of requests waiting to be synced to elasticsearch and the current sync lag.
+    """
+    print("Queued requests: {}".format(es_sync_redis.zcard(ES_SYNC_QUEUE_KEY)))
+    print("Sync lag: {:.2f}s".format(get_es_sync_lag()))
+
+
+@app.cli.command()
+@click.option("--verbose", is_flag=True, default=False, help="Print the full plan of every query.")
+def db_explain(verbose: bool = False):
+    """
+    Run EXPLAIN ANALYZE for the application's most frequent queries and flag sequential scans.
+
+    Sample values (a request, its agency, a user and a response token) are taken from the database.
+    """
+    request = Requests.query.order_by(Requests.date_submitted.desc()).first()
+    if request is None:
+        print("No requests to explain queries against.")
+        return
+    user_guid = db.session.query(UserRequests.user_guid).filter_by(request_id=request.id).limit(1).scalar()
+    response_token = ResponseTokens.query.first()
+
+    queries = {
+        "request history (request.api.views.get_request_events)": Events.query.filter(
+            Events.request_id == request.id,
+            Events.type.in_(event_type.FOR_REQUEST_HISTORY)
+        ).order_by(desc(Events.timestamp)),
+        "request responses (request.api.views.get_request_responses)": Responses.query.filter(
+            Responses.request_id == request.id,
+            Responses.type != response_type.EMAIL,
+            Responses.deleted == False  # noqa: E712
+        ).order_by(desc(Responses.date_modified)),
+        "point of contact (user_request.utils.get_current_point_of_contact)": UserRequests.query.filter_by(
+            request_id=request.id, point_of_contact=True),
+        "request users (Requests.user_requests)": request.user_requests,
+        "events by user (auth.utils._update_user_data)": Events.query.filter(
+            Events.new_value["user_guid"].astext == user_guid),
+        "agency overdue requests (flask extend-requests)": Requests.query.filter_by(
+            agency_ein=request.agency_ein, status=request_status.OVERDUE).order_by(Requests.id),
+        "agency open requests by due date (jobs._update_request_statuses)": Requests.query.filter(
+            Requests.agency_ein == request.agency_ein,
+            Requests.status != request_status.CLOSED,
+            Requests.due_date < datetime.utcnow()
+        ),
+    }
+    if response_token is not None:
+        queries["response token (response.views.get_response_content)"] = ResponseTokens.query.filter_by(
+            token=response_token.token, response_id=response_token.response_id)
+
+    num_seq_scans = 0
+    for name, query in queries.items():
+        plan, seq_scans = explain_analyze(query)
+        num_seq_scans += len(seq_scans)
+        print("{flag} {name}: {node} ({time:.3f} ms){seq_scans}".format(
+            flag="!!" if seq_scans else "ok",
+            name=name,
+            node=plan["Node Type"],
+            time=plan["Actual Total Time"],
+            seq_scans=" Seq Scan on {}".format(", ".join(seq_scans)) if seq_scans else ""))
+        if verbose:
+            print(json.dumps(plan, indent=2))
+    db.session.rollback()
+    print("{} sequential scan(s) in {} queries".format(num_seq_scans, len(queries)))
 
 
 @app.cli.command()
@@ -276,9 +354,14 @@ def extend_requests(agency_ein: str, agency_name: str, user_guid: str, extension
 
 
 @app.cli.command()
-def update_request_statuses():
+@click.option("--dry-run", is_flag=True, default=False,
+              help="Only report the number of requests that would be updated; nothing is written or sent.")
+def update_request_statuses(dry_run):
     try:
-        _update_request_statuses()
+        result = _update_request_statuses(dry_run=dry_run)
+        print("{prefix}{overdue} request(s) set to Overdue, {due_soon} set to Due Soon, "
+              "{agencies_notified} agencies notified in {elapsed:.2f}s".format(
+                  prefix="[dry run] " if dry_run else "", **result))
     except Exception:
         db.session.rollback()
         send_email(
@@ -5,4 +5,203 @@ This module contains the tests for the OpenRecords `/request` endpoint.
 """
 
 import pytest
-from app.models import Requests
\ No newline at end of file
+from app.models import Requests
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask_login import login_user
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app.constants import permission, user_type_request
+from app.lib.date_utils import utc_to_local
+from app.models import Agencies, AgencyUsers, Roles, UserRequests, Users
+from app.request.utils import create_request, generate_request_id
+
+
+def _create_agency(ein: str, parent_ein: str) -> Agencies:
+    return Agencies(
+        ein=ein,
+        parent_ein=parent_ein,
+        categories=[],
+        name="Request ID Test Agency {}".format(ein),
+        next_request_number=1,
+        default_email="agency@records.nyc.gov",
+        appeals_email="appeals@records.nyc.gov",
+        is_active=True,
+        agency_features=None,
+    )
+
+
+def test_generate_request_id_concurrent(app: Flask, db: SQLAlchemy, monkeypatch):
+    """Test request ids generated by parallel submissions for a parent agency and its sub-agency are unique.
+
+    Every thread uses its own connection (and commits), unlike the rest of the tests.
+
+    Args:
+        app (Flask): Instance of the Flask application
+        db (SQLAlchemy): DB instance setup for testing.
+    """
+    num_requests = 300
+    session_ = scoped_session(sessionmaker(bind=db.engine))
+    monkeypatch.setattr(db, "session", session_)
+    session_.add_all([_create_agency("0999", "999"), _create_agency("9991", "999")])
+    session_.commit()
+
+    def generate(agency_ein: str) -> str:
+        with app.app_context():
+            try:
+                return generate_request_id(agency_ein)
+            finally:
+                session_.remove()
+
+    try:
+        # fewer workers than pooled connections
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            request_ids = list(executor.map(generate, ["0999", "9991"] * (num_requests // 2)))
+
+        assert len(set(request_ids)) == num_requests
+        assert sorted(request_ids) == [
+            "FOIL-{}-999-{:05d}".format(datetime.utcnow().strftime("%Y"), number)
+            for number in range(1, num_requests + 1)
+        ]
+        assert Agencies.query.filter_by(ein="0999").one().next_request_number == num_requests + 1
+    finally:
+        session_.remove()
+        Agencies.query.filter(Agencies.ein.in_(["0999", "9991"])).delete(synchronize_session=False)
+        session_.commit()
+        session_.remove()
+
+
+def _create_agency_user(db: SQLAlchemy, guid: str, agency_ein: str, is_agency_admin: bool = False) -> Users:
+    user = Users(
+        guid=guid,
+        is_nyc_employee=True,
+        first_name="Agency",
+        last_name="User {}".format(guid),
+        email="{}@records.nyc.gov".format(guid),
+        email_validated=True,
+        terms_of_use_accepted=True,
+    )
+    db.session.add(user)
+    db.session.add(AgencyUsers(
+        user_guid=guid,
+        agency_ein=agency_ein,
+        is_agency_active=True,
+        is_agency_admin=is_agency_admin,
+        is_primary_agency=True,
+    ))
+    return user
+
+
+def _count_view_queries(client: Flask.test_client, db: SQLAlchemy, request_id: str) -> int:
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/request/view/{}".format(request_id))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_view_query_count(app: Flask, client: Flask.test_client, db: SQLAlchemy):
+    """Test the number of queries run by the view request page does not depend on the number of agency users.
+
+    Args:
+        app (Flask): Instance of the Flask application
+        client (Flask.test_client): Test client for the Flask application
+        db (SQLAlchemy): DB instance setup for testing.
+    """
+    agency = _create_agency("0998", "998")
+    agency.agency_features = {"letters": {"generate_letters": False}, "custom_request_forms": {"enabled": False}}
+    db.session.add(agency)
+    admin = _create_agency_user(db, "viewadmin", agency.ein, is_agency_admin=True)
+    now = datetime.utcnow()
+    request = Requests(
+        id="FOIL-{}-998-00001".format(now.strftime("%Y")),
+        title="View Query Count",
+        description="View Query Count",
+        agency_ein=agency.ein,
+        date_created=now,
+        date_submitted=now,
+        due_date=now + timedelta(days=20),
+    )
+    db.session.add(request)
+    db.session.add(UserRequests(
+        user_guid=admin.guid,
+        request_id=request.id,
+        request_user_type=user_type_request.AGENCY,
+        permissions=permission.ADD_USER_TO_REQUEST | permission.EDIT_USER_REQUEST_PERMISSIONS,
+    ))
+
+    def assign_users(start, stop):
+        for i in range(start, stop):
+            user = _create_agency_user(db, "viewuser{}".format(i), agency.ein)
+            if i % 2:
+                db.session.add(UserRequests(
+                    user_guid=user.guid,
+                    request_id=request.id,
+                    request_user_type=user_type_request.AGENCY,
+                    permissions=permission.ADD_NOTE,
+                ))
+        db.session.commit()
+
+    with client.session_transaction() as session:
+        session["_user_id"] = admin.guid
+        session["_fresh"] = True
+        session["mfa_verified"] = True
+
+    assign_users(0, 2)
+    num_queries = _count_view_queries(client, db, request.id)
+    assign_users(2, 20)
+
+    assert _count_view_queries(client, db, request.id) == num_queries
+
+
+def test_create_request_parent_agency_admin(app: Flask, db: SQLAlchemy, monkeypatch):
+    """Test an administrator of both an agency and its monitoring parent agency is added to a new request once.
+
+    Args:
+        app (Flask): Instance of the Flask application
+        db (SQLAlchemy): DB instance setup for testing.
+    """
+    monkeypatch.setitem(app.config, "ELASTICSEARCH_ENABLED", False)
+    Roles.populate()
+    parent = _create_agency("0996", "996")
+    agency = _create_agency("9961", "996")
+    parent.agency_features = {"monitor_agency_requests": [agency.ein]}
+    db.session.add_all([parent, agency])
+    admin = _create_agency_user(db, "parentadmin", agency.ein, is_agency_admin=True)
+    db.session.add(AgencyUsers(
+        user_guid=admin.guid,
+        agency_ein=parent.ein,
+        is_agency_active=True,
+        is_agency_admin=True,
+        is_primary_agency=False,
+    ))
+    db.session.commit()
+
+    tz_name = app.config["APP_TIMEZONE"]
+    with app.test_request_context():
+        login_user(admin)
+        request_id = create_request(
+            "Parent Agency Administrator",
+            "Parent Agency Administrator",
+            None,
+            tz_name,
+            agency_ein=agency.ein,
+            first_name="Public",
+            last_name="Requester",
+            agency_date_submitted_local=utc_to_local(datetime.utcnow(), tz_name),
+            email="requester@records.nyc.gov",
+        )
+
+    assert UserRequests.query.filter_by(request_id=request_id, user_guid=admin.guid).count() == 1
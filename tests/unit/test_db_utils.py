@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""DB Utils Test Module
+
+This module contains the tests for app.lib.db_utils
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import SQLAlchemyError
+
+import app.lib.db_utils as db_utils
+from app.constants import permission, user_type_request
+from app.models import Agencies, Requests, UserRequests, Users
+
+
+@pytest.fixture
+def requests(db: SQLAlchemy):
+    """Create two requests of one agency, each with its own requester; yields the requests."""
+    agency = Agencies(
+        ein="0997",
+        parent_ein="997",
+        categories=[],
+        name="DB Utils Test Agency",
+        next_request_number=1,
+        default_email="agency@records.nyc.gov",
+        appeals_email="appeals@records.nyc.gov",
+        is_active=True,
+        agency_features=None,
+    )
+    db.session.add(agency)
+    now = datetime.utcnow()
+    requests_ = []
+    for i in range(2):
+        requester = Users(
+            guid="dbutilsrequester{}".format(i),
+            is_nyc_employee=False,
+            first_name="Requester",
+            last_name="{}".format(i),
+            email="dbutilsrequester{}@email.com".format(i),
+            email_validated=True,
+            terms_of_use_accepted=True,
+        )
+        request = Requests(
+            id="FOIL-{}-997-{:05d}".format(now.strftime("%Y"), i + 1),
+            title="DB Utils {}".format(i),
+            description="DB Utils {}".format(i),
+            agency_ein=agency.ein,
+            date_created=now,
+            date_submitted=now,
+            due_date=now + timedelta(days=20),
+        )
+        db.session.add_all([requester, request])
+        db.session.add(UserRequests(
+            user_guid=requester.guid,
+            request_id=request.id,
+            request_user_type=user_type_request.REQUESTER,
+            permissions=permission.NONE,
+        ))
+        requests_.append(request)
+    db.session.commit()
+    request_ids = [request.id for request in requests_]
+    # bulk_update_objects does not update objects already loaded in the session
+    db.session.expunge_all()
+    yield request_ids
+
+
+@pytest.fixture
+def es_index_requests(app: Flask, monkeypatch):
+    """Record the request ids indexed by bulk_update_objects instead of indexing them."""
+    indexed = []
+    monkeypatch.setitem(app.config, "ELASTICSEARCH_ENABLED", True)
+    monkeypatch.setattr(db_utils, "es_index_requests", indexed.append)
+    return indexed
+
+
+def test_bulk_update_objects_json(requests, es_index_requests):
+    """Test dictionary values are merged into the existing json values of each record."""
+    db_utils.bulk_update_objects(Requests, {
+        requests[0]: {"privacy": {"title": True}},
+        requests[1]: {"privacy": {"agency_request_summary": False}, "title": "Updated"},
+    }, es_update=False)
+
+    assert [(request.privacy, request.title) for request in Requests.query.filter(
+        Requests.id.in_(requests)).order_by(Requests.id)] == [
+        ({"title": True, "agency_request_summary": True}, "DB Utils 0"),
+        ({"title": False, "agency_request_summary": False}, "Updated"),
+    ]
+    assert es_index_requests == []
+
+
+def test_bulk_update_objects_es(requests, es_index_requests):
+    """Test the request docs of the updated requests, or of the requests of the updated requesters, are indexed."""
+    db_utils.bulk_update_objects(Requests, {request_id: {"title": "Updated"} for request_id in requests})
+    db_utils.bulk_update_objects(Users, {"dbutilsrequester1": {"first_name": "Updated"}})
+
+    assert es_index_requests == [requests, [requests[1]]]
+
+
+def test_bulk_update_objects_error(db: SQLAlchemy, requests, es_index_requests, monkeypatch):
+    """Test a failed update is rolled back and raised, and nothing is indexed."""
+    def bulk_update_mappings(*args, **kwargs):
+        raise SQLAlchemyError("bulk update failed")
+
+    monkeypatch.setattr(db.session, "bulk_update_mappings", bulk_update_mappings)
+
+    with pytest.raises(SQLAlchemyError):
+        db_utils.bulk_update_objects(Requests, {requests[0]: {"title": "Updated"}})
+    assert es_index_requests == []
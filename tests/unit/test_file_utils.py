@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""File Utils Test Module
+
+This module contains the tests for app.lib.file_utils
+"""
+import hashlib
+import os
+import socket
+import threading
+from time import perf_counter, sleep
+
+import magic
+import pytest
+from flask import Flask
+
+import app.lib.file_utils as fu
+
+paramiko = pytest.importorskip("paramiko")
+
+
+class _StubServer(paramiko.ServerInterface):
+    """SSH server accepting any password."""
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _StubSFTPServer(paramiko.SFTPServerInterface):
+    """SFTP server for the local filesystem."""
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(path, flags, 0o644)
+            mode = "rb" if not flags & (os.O_WRONLY | os.O_RDWR) else "r+b" if flags & os.O_RDWR else "wb"
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _StubSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        os.remove(path)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        os.rename(oldpath, newpath)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        os.mkdir(path)
+        return paramiko.SFTP_OK
+
+
+@pytest.fixture(scope="module")
+def sftp_server():
+    """Run a local paramiko SFTP server; yields (port, list of accepted connections)."""
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(100)
+    connections = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _StubSFTPServer)
+            transport.start_server(server=_StubServer())
+            connections.append(transport)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()[1], connections
+    listener.close()
+    for transport in connections:
+        transport.close()
+
+
+@pytest.fixture
+def use_sftp(app: Flask, sftp_server, monkeypatch):
+    port, connections = sftp_server
+    for key, value in (("USE_SFTP", True),
+                       ("SFTP_HOSTNAME", "127.0.0.1"),
+                       ("SFTP_PORT", port),
+                       ("SFTP_USERNAME", "openrecords"),
+                       ("SFTP_PASSWORD", "openrecords")):
+        monkeypatch.setitem(app.config, key, value)
+    fu.sftp_pool.clear()
+    del connections[:]
+    yield connections
+    fu.sftp_pool.clear()
+
+
+def test_sftp_pool_reuses_sessions(use_sftp, tmp_path):
+    """Test consecutive and batched file operations reuse one SFTP session."""
+    path = tmp_path / "records.txt"
+    path.write_bytes(b"records" * 1000)
+
+    assert fu.getsize(str(path)) == 7000
+    assert fu.exists(str(path))
+    with fu.sftp_batch():
+        assert fu.get_hash(str(path))
+        assert not fu.exists(str(tmp_path / "missing.txt"))
+
+    assert len(use_sftp) == 1
+
+
+def test_sftp_send_file(app: Flask, use_sftp, tmp_path):
+    """Test files streamed from the SFTP server support range and conditional requests.
+
+    Streamed responses are closed by the WSGI server after the app context is popped;
+    their SFTP sessions must still be returned to the pool.
+    """
+    path = tmp_path / "records.txt"
+    path.write_bytes(b"records" * 1000)
+    download_app = Flask(__name__)
+    download_app.config.update(app.config)
+
+    @download_app.route("/download")
+    def download():
+        return fu.send_file(str(tmp_path), "records.txt", etag="records-hash")
+
+    client = download_app.test_client()
+    for headers, status_code, data in (({}, 200, b"records" * 1000),
+                                       ({"Range": "bytes=7-13"}, 206, b"records"),
+                                       ({"If-None-Match": '"records-hash"'}, 304, b"")):
+        response = client.get("/download", headers=headers)
+        assert response.status_code == status_code
+        assert response.get_data() == data
+        response.close()
+
+    assert len(use_sftp) == 1
+
+
+@pytest.mark.benchmark
+def test_sftp_pool_benchmark(use_sftp, tmp_path):
+    """
+    Benchmark of pooled SFTP file operations against a new connection per operation.
+
+    Run with "pytest -s -m benchmark tests/unit/test_file_utils.py" to see operations/sec.
+    """
+    path = tmp_path / "records.txt"
+    path.write_bytes(b"records")
+    num_ops = 20
+
+    def new_connection_per_operation():
+        transport, sftp = fu._sftp_connect()
+        try:
+            return sftp.stat(str(path)).st_size
+        finally:
+            sftp.close()
+            transport.close()
+
+    rates = {}
+    for name, get_size in (("new connection per operation", new_connection_per_operation),
+                           ("pooled", lambda: fu.getsize(str(path)))):
+        start = perf_counter()
+        for _ in range(num_ops):
+            assert get_size() == 7
+        rates[name] = num_ops / (perf_counter() - start)
+        print("{}: {:.0f} ops/sec".format(name, rates[name]))
+
+
+def test_get_file_metadata(app: Flask, tmp_path):
+    """Test get_file_metadata matches reading the whole file for a file larger than one chunk."""
+    path = tmp_path / "records.txt"
+    contents = b"records\n" * (fu.FILE_CHUNK_SIZE // 4)
+    path.write_bytes(contents)
+
+    assert fu.get_file_metadata(str(path)) == (
+        len(contents),
+        fu.os_get_mime_type(str(path)),
+        hashlib.sha1(contents).hexdigest()
+    )
+    assert fu.os_get_hash(str(path)) == hashlib.sha1(contents).hexdigest()
+
+
+def _get_mime_type_samples(app: Flask):
+    """Return the paths of (up to 10) sample images and the repository's magic file."""
+    sample_dir = os.path.join(app.static_folder, "img")
+    samples = [os.path.join(sample_dir, name) for name in sorted(os.listdir(sample_dir))][:10]
+    return samples, os.path.join(os.path.dirname(app.root_path), "magic")
+
+
+def test_os_get_mime_type(app: Flask, monkeypatch):
+    """Test mime types detected with the cached magic detector match those of a new detector."""
+    samples, magic_file = _get_mime_type_samples(app)
+    monkeypatch.setitem(app.config, "MAGIC_FILE", magic_file)
+
+    assert [fu.os_get_mime_type(path) for path in samples * 2] == [
+        magic.Magic(magic_file=magic_file, mime=True).from_file(path) for path in samples * 2
+    ]
+    assert fu.get_magic(magic_file) is fu.get_magic(magic_file)
+    assert fu.get_magic(magic_file) is not fu.get_magic()
+
+
+@pytest.mark.benchmark
+def test_mime_type_benchmark(app: Flask, monkeypatch):
+    """
+    Benchmark of mime type checks with the cached magic detector against building one per check.
+
+    Run with "pytest -s -m benchmark tests/unit/test_file_utils.py" to see checks/sec.
+    """
+    samples, magic_file = _get_mime_type_samples(app)
+    monkeypatch.setitem(app.config, "MAGIC_FILE", magic_file)
+    num_rounds = 3
+
+    def magic_per_check(path):
+        return magic.Magic(magic_file=magic_file, mime=True).from_file(path)
+
+    for name, get_mime_type in (("magic.Magic per check", magic_per_check),
+                                ("cached", fu.os_get_mime_type)):
+        start = perf_counter()
+        for _ in range(num_rounds):
+            for path in samples:
+                get_mime_type(path)
+        print("{}: {:.0f} checks/sec".format(name, num_rounds * len(samples) / (perf_counter() - start)))
+
+
+@pytest.mark.skipif(not os.environ.get("AZURE_STORAGE_CONNECTION_STRING"),
+                    reason="requires an Azure storage account or the Azurite emulator "
+                           "(e.g. AZURE_STORAGE_CONNECTION_STRING=UseDevelopmentStorage=true)")
+def test_azure_blobs(app: Flask, monkeypatch, tmp_path):
+    """Test chunked uploads and downloads, streaming and copying of blobs with the shared service client."""
+    for key, value in (("AZURE_STORAGE_CONNECTION_STRING", os.environ["AZURE_STORAGE_CONNECTION_STRING"]),
+                       ("AZURE_STORAGE_CONTAINER", "openrecords-test"),
+                       ("AZURE_STORAGE_MAX_BLOCK_SIZE", 64 * 1024),
+                       ("AZURE_STORAGE_MAX_SINGLE_PUT_SIZE", 64 * 1024)):
+        monkeypatch.setitem(app.config, key, value)
+    assert fu.get_azure_service_client() is fu.get_azure_service_client()
+    container_client = fu.get_azure_service_client().get_container_client("openrecords-test")
+    if not container_client.exists():
+        container_client.create_container()
+
+    contents = os.urandom(1024 * 1024)
+    path = tmp_path / "records.bin"
+    path.write_bytes(contents)
+    fu.azure_upload(str(path), "FOIL-2019-002-00001/records.bin")
+    assert not path.exists()
+    assert fu.azure_exists("FOIL-2019-002-00001/records.bin")
+
+    fu.azure_download("FOIL-2019-002-00001/records.bin", str(path))
+    assert path.read_bytes() == contents
+    assert b"".join(fu.azure_stream("FOIL-2019-002-00001/records.bin")) == contents
+
+    fu.azure_copy("FOIL-2019-002-00001/records.bin", "FOIL-2019-002-00001/deleted/records.bin")
+    for _ in range(50):
+        properties = fu.create_azure_blob_client("FOIL-2019-002-00001/deleted/records.bin").get_blob_properties()
+        if properties.copy.status != "pending":
+            break
+        sleep(0.1)
+    assert properties.copy.status == "success"
+
+    fu.azure_delete("FOIL-2019-002-00001/records.bin")
+    fu.azure_delete("FOIL-2019-002-00001/deleted/records.bin")
+    assert not fu.azure_exists("FOIL-2019-002-00001/records.bin")
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Search Utils Test Module
+
+This module contains the tests for app.search.utils
+"""
+import copy
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytest
+
+from app.constants import ES_DATETIME_FORMAT
+from app.lib.date_utils import utc_to_local
+from app.search.utils import RequestsDSLGenerator, convert_dates
+
+
+def _legacy_convert_dates(results, dt_format=None, tz_name=None):
+    """convert_dates as it was before each distinct timestamp was only parsed once."""
+    for hit in results["hits"]["hits"]:
+        for field in ("date_submitted", "date_due", "date_received", "date_closed"):
+            dt_field = hit["_source"].get(field, None)
+            if dt_field is not None and dt_field:
+                dt = datetime.strptime(hit["_source"][field], ES_DATETIME_FORMAT)
+            else:
+                continue
+            if tz_name:
+                dt = utc_to_local(dt, tz_name)
+            hit["_source"][field] = (
+                dt.strftime(dt_format) if dt_format is not None else dt
+            )
+
+
+def _make_results(num_hits):
+    """Return mock elasticsearch search results with num_hits hits."""
+    start = datetime(2019, 1, 1)
+    hits = []
+    for i in range(num_hits):
+        submitted = start + timedelta(days=random.randrange(365), seconds=random.randrange(86400))
+        hits.append({
+            "_id": "FOIL-2019-002-{:05d}".format(i),
+            "_source": {
+                "date_submitted": submitted.strftime(ES_DATETIME_FORMAT),
+                "date_received": submitted.strftime(ES_DATETIME_FORMAT),
+                "date_due": (submitted.replace(hour=17, minute=0, second=0) + timedelta(days=5)).strftime(
+                    ES_DATETIME_FORMAT),
+                "date_closed": None if i % 2 else (submitted + timedelta(days=3)).strftime(ES_DATETIME_FORMAT),
+            }
+        })
+    return {"hits": {"total": num_hits, "hits": hits}}
+
+
+@pytest.mark.parametrize("dt_format,tz_name", [
+    (None, None),
+    ("%m/%d/%Y", None),
+    (None, "America/New_York"),
+    ("%m/%d/%Y %I:%M %p", "America/New_York"),
+])
+def test_convert_dates(dt_format, tz_name):
+    """Test convert_dates converts dates exactly as strptime conversion of every date does."""
+    results = _make_results(100)
+    expected = copy.deepcopy(results)
+
+    convert_dates(results, dt_format, tz_name)
+    _legacy_convert_dates(expected, dt_format, tz_name)
+
+    assert results == expected
+
+
+@pytest.mark.benchmark
+def test_convert_dates_benchmark():
+    """
+    Micro-benchmark of convert_dates against strptime conversion of every date.
+
+    Run with "pytest -s -m benchmark tests/unit/test_search_utils.py" to see rows/sec.
+    """
+    num_hits = 10000
+    rates = {}
+    for name, convert in (("strptime per date", _legacy_convert_dates), ("convert_dates", convert_dates)):
+        results = _make_results(num_hits)
+        start = perf_counter()
+        convert(results, None, "America/New_York")
+        rates[name] = num_hits / (perf_counter() - start)
+        print("{}: {:.0f} rows/sec".format(name, rates[name]))
+
+
+@pytest.mark.parametrize("query,foil_id_filter", [
+    ("2019-002", {"term": {"foil_id.ngram": "2019-002"}}),
+    ("01", {"wildcard": {"foil_id": "*01*"}}),
+    ("foil-2019-002-00001", {"term": {"foil_id.ngram": "foil-2019-002-00001"}}),
+    ("foil-2019-002-000011", {"wildcard": {"foil_id": "*FOIL-2019-002-000011*"}}),
+])
+def test_foil_id_dsl(query, foil_id_filter):
+    """Test FOIL ID lookups shorter or longer than the indexed ngrams fall back to a wildcard query."""
+    dsl_gen = RequestsDSLGenerator(query, {}, ["Open"], [], None, None, None, "match")
+
+    assert dsl_gen.foil_id()["query"]["bool"]["must"][0] == foil_id_filter